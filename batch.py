@@ -0,0 +1,173 @@
+"""
+batch.py - Apply one filter chain to many images with a process pool.
+
+Inputs are given as a directory or a glob pattern. Each image is opened,
+filtered and saved inside a worker process, so a failure only affects that
+file and the run continues. Throughput is reported once everything is done.
+Animated and multi-page inputs have every frame filtered (see frames.py).
+"""
+
+import glob
+import os
+import time
+from multiprocessing import Pool
+
+import formats
+import frames
+import functions as F
+import interface
+from interface import _col, BOLD, CYAN, GREEN, RED, YELLOW
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".gif", ".tif", ".tiff", ".webp")
+
+
+def find_inputs(source: str):
+    """Return the image files in a directory, or the files matching a glob pattern."""
+    if os.path.isdir(source):
+        paths = [os.path.join(source, name) for name in os.listdir(source) if name.lower().endswith(IMAGE_EXTENSIONS)]
+    else:
+        paths = glob.glob(source)
+    return sorted(p for p in paths if os.path.isfile(p))
+
+
+def output_paths(inputs, output_dir: str):
+    """Map each input to its output under output_dir, keeping the folders below the inputs' common directory.
+
+    Raises ValueError if two inputs would be written to the same file (for
+    example a.png and a.jpg with --format png), or an output would replace
+    any of the inputs (for example --outdir naming the source folder).
+    """
+    root = os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path in inputs])
+    outputs = {path: os.path.join(output_dir, os.path.relpath(os.path.abspath(path), root)) for path in inputs}
+    sources = {os.path.normcase(os.path.realpath(path)): path for path in inputs}
+    seen = {}
+    for path, out_path in outputs.items():
+        key = os.path.normcase(os.path.realpath(formats.output_path(out_path)))
+        if key in sources:
+            raise ValueError(f"{formats.output_path(out_path)} would overwrite the input {sources[key]}")
+        if key in seen:
+            raise ValueError(f"{seen[key]} and {path} would both be written to {formats.output_path(out_path)}")
+        seen[key] = path
+    return outputs
+
+
+def _init_worker(backend: str, border: str, threads: int, save_format, save_options):
+    # Module settings are not inherited when workers are spawned rather than forked
+    F.set_backend(backend)
+    F.set_border(border)
+    F.set_threads(threads)
+    formats.set_save_options(save_format, **save_options)
+
+
+def worker_settings(threads: int):
+    """Return the initargs that give a worker process this process's settings."""
+    return F.backend, F.border, threads, formats.save_format, formats.save_options
+
+
+def _process(job):
+    """Filter one image. Returns (path, error, pixels, seconds, saved); error is None on success.
+
+    saved is (output path, encode seconds, bytes) for the written file, or None.
+    """
+    path, out_path, steps = job
+    start = time.perf_counter()
+    try:
+        if frames.is_animated(path):
+            saved, _, pixels = frames.process_frames(path, out_path, steps)
+            return path, None, pixels, time.perf_counter() - start, saved
+        img = formats.open_image(path)
+        interface.apply_steps(img, steps)
+        saved = formats.save(img, out_path)
+        w, h = img.size
+        return path, None, w * h, time.perf_counter() - start, saved
+    except Exception as e:
+        return path, str(e), 0, time.perf_counter() - start, None
+
+
+def prepare(source: str, output_dir: str, tokens):
+    """Find the inputs and plan the chain for a multi-image run, creating the output folders.
+
+    Returns (outputs, steps), where outputs maps each input to its output
+    path (see output_paths); steps is empty if there is nothing to do.
+    """
+    inputs = find_inputs(source)
+    if not inputs:
+        print(_col("No images found for", YELLOW), _col(source, BOLD))
+        return {}, []
+    try:
+        outputs = output_paths(inputs, output_dir)
+    except ValueError as e:
+        print(_col("Cannot write outputs:", RED), _col(str(e), RED))
+        return {}, []
+    steps = interface.plan_chain(tokens)
+    if not steps:
+        print(_col("No valid filters to apply.", YELLOW))
+        return outputs, []
+    for out_path in outputs.values():
+        os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    return outputs, steps
+
+
+def run_batch(source: str, output_dir: str, tokens, workers: int = None, threads: int = 1):
+    """Apply the filter tokens to every image in source, writing results to output_dir.
+
+    Parameters are asked for once, before the pool starts. Each worker uses
+    `threads` threads per image. Returns the list of (path, error) pairs for
+    the files that failed.
+    """
+    outputs, steps = prepare(source, output_dir, tokens)
+    if not steps:
+        return []
+    jobs = [(path, out_path, steps) for path, out_path in outputs.items()]
+    workers = max(1, min(workers or os.cpu_count() or 1, len(jobs)))
+
+    print(_col("Processing", YELLOW), _col(str(len(jobs)), BOLD), _col("images with", YELLOW), _col(str(workers), BOLD), _col("worker(s) ...", YELLOW))
+    failures = []
+    pixels = 0
+    saved = []
+    start = time.perf_counter()
+    if workers == 1:
+        F.set_threads(threads)
+        results = map(_process, jobs)
+        pool = None
+    else:
+        pool = Pool(workers, initializer=_init_worker, initargs=worker_settings(threads))
+        results = pool.imap_unordered(_process, jobs)
+    try:
+        for path, error, count, _, written in results:
+            if error is None:
+                pixels += count
+                saved.append(written)
+                report_saved(*written)
+            else:
+                failures.append((path, error))
+                print(_col("Failed:", RED), _col(path, BOLD), "->", _col(error, RED))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    elapsed = time.perf_counter() - start
+    report(len(jobs), failures, pixels, elapsed, output_dir, saved)
+    return failures
+
+
+def report_saved(path: str, seconds: float, size: int):
+    print(_col("Wrote", GREEN), _col(path, BOLD), _col(f"({formats.describe(seconds, size)})", CYAN))
+
+
+def report(total: int, failures, pixels: int, elapsed: float, output_dir: str, saved=()):
+    """Print the summary and throughput of a multi-image run.
+
+    saved holds (path, encode seconds, bytes) for every written file.
+    """
+    done = total - len(failures)
+    megapixels = pixels / 1e6
+    print(_col("Done:", GREEN), _col(f"{done}/{total}", BOLD), "images written to", _col(output_dir, BOLD))
+    if failures:
+        print(_col("Failures:", RED), _col(str(len(failures)), BOLD))
+    if saved:
+        seconds = sum(s for _, s, _ in saved)
+        size = sum(b for _, _, b in saved)
+        print(_col("Encoded:", CYAN), formats.describe(seconds, size))
+    if elapsed > 0:
+        print(_col("Throughput:", CYAN), f"{elapsed:.2f}s, {done / elapsed:.1f} images/s, {megapixels / elapsed:.2f} MP/s ({megapixels:.1f} MP total)")
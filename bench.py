@@ -0,0 +1,352 @@
+"""
+bench.py - Benchmark every filter across image sizes and backends.
+
+Runs each entry of `interface.FILTERS` on synthetic images with fixed
+parameters in place of the input() prompts, and reports wall time,
+megapixels per second and peak traced memory. Results can be written to
+JSON and compared against a saved baseline to flag regressions.
+
+Startup latency of `python main.py --list` is tracked the same way, and
+the run warns if that command imports the imaging stack.
+
+`--scaling N` instead times the numpy backend on the largest size with 1
+to N threads and reports the speedup and parallel efficiency of each count.
+
+`--calibrate` measures each filter's cost per pixel on RGB and grayscale
+images and stores it for the recipe planner's time estimates.
+
+    python bench.py --sizes 256x256,1024x1024 --save bench.json
+    python bench.py --baseline bench.json
+    python bench.py --sizes 4096x4096 --scaling 32
+    python bench.py --calibrate --threads 8
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import PIL
+from PIL import Image
+
+import functions as F
+import interface
+from interface import _col, BOLD, CYAN, GREEN, RED, YELLOW
+
+DEFAULT_SIZES = "128x128,512x512,2048x2048"
+
+MAIN_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+STARTUP_NAME = "Startup (main.py --list)"
+
+# Modules that listing, help and argument errors must not import
+HEAVY_MODULES = ("PIL", "numpy", "engine", "colorama")
+
+# Fixed parameters for filters that normally prompt for a value
+BENCH_PARAMS = {
+    "increase_brightness": {"amount": 40},
+    "decrease_brightness": {"amount": 40},
+    "pixelate": {"block_size": 8},
+}
+
+# Image size each backend is calibrated on; the reference loops are slow
+CALIBRATION_SIZES = {"numpy": (512, 512), "reference": (96, 96)}
+
+
+def synthetic_image(width: int, height: int):
+    """Return a deterministic RGB test image with smooth and detailed regions."""
+    r = Image.linear_gradient("L").resize((width, height))
+    g = Image.effect_mandelbrot((width, height), (-2.0, -1.2, 0.8, 1.2), 64)
+    b = Image.radial_gradient("L").resize((width, height))
+    return Image.merge("RGB", (r, g, b))
+
+
+def parse_sizes(text: str):
+    sizes = []
+    for part in text.split(","):
+        w, _, h = part.strip().lower().partition("x")
+        sizes.append((int(w), int(h or w)))
+    return sizes
+
+
+def bench_filter(func, base, repeat: int = 3):
+    """Time func on copies of base. Returns (best_seconds, peak_bytes)."""
+    params = BENCH_PARAMS.get(func.__name__, {})
+    best = None
+    for _ in range(repeat):
+        img = base.copy()
+        start = time.perf_counter()
+        func(img, **params)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    # Memory is measured on a separate run so tracing does not skew timings
+    img = base.copy()
+    tracemalloc.start()
+    try:
+        func(img, **params)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return best, peak
+
+
+def run(sizes, backends, repeat: int = 3, reference_max_mp: float = 0.3):
+    """Benchmark every filter; returns a list of result dicts."""
+    results = []
+    saved_backend = F.backend
+    try:
+        for width, height in sizes:
+            base = synthetic_image(width, height)
+            megapixels = width * height / 1e6
+            for backend in backends:
+                if backend == "reference" and megapixels > reference_max_mp:
+                    print(_col("Skipping reference backend at", YELLOW), _col(f"{width}x{height}", BOLD),
+                          _col(f"(over {reference_max_mp} MP)", YELLOW))
+                    continue
+                F.set_backend(backend)
+                for name, func in interface.FILTERS:
+                    seconds, peak = bench_filter(func, base, repeat)
+                    results.append({
+                        "filter": name,
+                        "backend": backend,
+                        "size": f"{width}x{height}",
+                        "megapixels": megapixels,
+                        "seconds": seconds,
+                        "mp_per_s": megapixels / seconds if seconds > 0 else float("inf"),
+                        "peak_mb": peak / 1e6,
+                        "threads": F.threads,
+                    })
+                    print_row(results[-1])
+    finally:
+        F.backend = saved_backend
+    return results
+
+
+def thread_counts(max_threads: int):
+    """Return 1, 2, 4, ... up to max_threads, always ending with max_threads."""
+    counts = []
+    n = 1
+    while n < max_threads:
+        counts.append(n)
+        n *= 2
+    return counts + [max_threads]
+
+
+def run_scaling(size, max_threads: int, repeat: int = 3):
+    """Time every filter on the numpy backend with 1..max_threads threads."""
+    width, height = size
+    base = synthetic_image(width, height)
+    megapixels = width * height / 1e6
+    results = []
+    saved = F.backend, F.threads
+    print(_col(f"{'Filter':<22} {'Threads':>7} {'Size':>11} {'Time (s)':>10} {'MP/s':>10} {'Speedup':>8} {'Eff.':>6}", BOLD))
+    try:
+        F.set_backend("numpy")
+        for name, func in interface.FILTERS:
+            # Untimed warm-up so one-off setup is not counted against one thread
+            func(base.copy(), **BENCH_PARAMS.get(func.__name__, {}))
+            single = None
+            for n in thread_counts(max_threads):
+                F.set_threads(n)
+                seconds, peak = bench_filter(func, base, repeat)
+                single = single or seconds
+                speedup = single / seconds if seconds > 0 else float("inf")
+                results.append({
+                    "filter": name,
+                    "backend": "numpy",
+                    "size": f"{width}x{height}",
+                    "megapixels": megapixels,
+                    "seconds": seconds,
+                    "mp_per_s": megapixels / seconds if seconds > 0 else float("inf"),
+                    "peak_mb": peak / 1e6,
+                    "threads": n,
+                    "speedup": speedup,
+                })
+                print(f"{name:<22} {n:>7} {results[-1]['size']:>11} {seconds:>10.4f} "
+                      f"{results[-1]['mp_per_s']:>10.2f} {speedup:>7.2f}x {speedup / n:>6.0%}")
+    finally:
+        F.set_backend(saved[0])
+        F.set_threads(saved[1])
+    return results
+
+
+def run_calibration(backend: str, repeat: int = 3):
+    """Measure every filter on backend in nanoseconds per pixel. Returns {filter: (rgb_ns, gray_ns)}."""
+    width, height = CALIBRATION_SIZES[backend]
+    base = synthetic_image(width, height)
+    gray = base.convert("L")
+    pixels = width * height
+    costs = {}
+    saved = F.backend
+    print(_col(f"{'Filter':<22} {'Backend':<10} {'RGB ns/px':>10} {'Gray ns/px':>11}", BOLD))
+    try:
+        F.set_backend(backend)
+        for name, func in interface.FILTERS:
+            # Untimed warm-up so one-off setup is not counted
+            func(base.copy(), **BENCH_PARAMS.get(func.__name__, {}))
+            rgb, _ = bench_filter(func, base, repeat)
+            single, _ = bench_filter(func, gray, repeat)
+            costs[func.__name__] = (rgb * 1e9 / pixels, single * 1e9 / pixels)
+            print(f"{name:<22} {backend:<10} {costs[func.__name__][0]:>10.1f} {costs[func.__name__][1]:>11.1f}")
+    finally:
+        F.set_backend(saved)
+    return costs
+
+
+def startup_latency(runs: int = 10):
+    """Time `python main.py --list` in fresh interpreters. Returns (best, median) seconds."""
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, MAIN_SCRIPT, "--list"], stdout=subprocess.DEVNULL, check=True)
+        times.append(time.perf_counter() - start)
+    return min(times), statistics.median(times)
+
+
+def startup_imports():
+    """Return the heavy modules imported by `python main.py --list` (should be empty)."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", MAIN_SCRIPT, "--list"],
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=True)
+    imported = {line.rsplit("|", 1)[-1].strip().split(".")[0] for line in proc.stderr.splitlines() if "|" in line}
+    return [m for m in HEAVY_MODULES if m in imported]
+
+
+def run_startup(runs: int = 10):
+    """Measure startup latency; returns a result dict in the same shape as filter results."""
+    best, median = startup_latency(runs)
+    print(_col(STARTUP_NAME + ":", CYAN), f"best {best * 1000:.1f} ms, median {median * 1000:.1f} ms over {runs} runs")
+    heavy = startup_imports()
+    if heavy:
+        print(_col("WARNING:", RED), "main.py --list imports", _col(", ".join(heavy), BOLD))
+    return {
+        "filter": STARTUP_NAME,
+        "backend": "-",
+        "size": "-",
+        "megapixels": 0,
+        "seconds": median,
+        "mp_per_s": 0,
+        "peak_mb": 0,
+        "heavy_imports": heavy,
+    }
+
+
+def print_header():
+    print(_col(f"{'Filter':<22} {'Backend':<10} {'Size':>11} {'Time (s)':>10} {'MP/s':>10} {'Peak MB':>9}", BOLD))
+
+
+def print_row(row):
+    print(f"{row['filter']:<22} {row['backend']:<10} {row['size']:>11} {row['seconds']:>10.4f} "
+          f"{row['mp_per_s']:>10.2f} {row['peak_mb']:>9.1f}")
+
+
+def compare(results, baseline, threshold: float = 0.2):
+    """Print results that are slower than baseline by more than threshold. Returns them."""
+    def key(r):
+        return r["filter"], r["backend"], r["size"], r.get("threads", 1)
+
+    previous = {key(r): r for r in baseline["results"]}
+    regressions = []
+    for row in results:
+        old = previous.get(key(row))
+        if old is None or old["seconds"] <= 0:
+            continue
+        ratio = row["seconds"] / old["seconds"]
+        if ratio > 1 + threshold:
+            regressions.append((row, ratio))
+            print(_col("REGRESSION:", RED), _col(row["filter"], BOLD), row["backend"], row["size"],
+                  f"{old['seconds']:.4f}s -> {row['seconds']:.4f}s ({ratio:.2f}x)")
+    if not regressions:
+        print(_col("No regressions against baseline", GREEN), f"(threshold {threshold:.0%})")
+    return regressions
+
+
+def metadata():
+    try:
+        import numpy
+        numpy_version = numpy.__version__
+    except ImportError:
+        numpy_version = None
+    return {
+        "python": platform.python_version(),
+        "pillow": PIL.__version__,
+        "numpy": numpy_version,
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="bench.py", description="Benchmark image filters")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="comma-separated WxH sizes (default: %(default)s)")
+    parser.add_argument("--backends", default=",".join(b for b in F.BACKENDS if b != "numpy" or F.HAVE_NUMPY),
+                        help="comma-separated backends to run (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per measurement; the fastest is kept (default: 3)")
+    parser.add_argument("--reference-max-mp", type=float, default=0.3,
+                        help="skip the reference backend above this many megapixels (default: 0.3)")
+    parser.add_argument("--startup-runs", type=int, default=10, help="fresh interpreters timed for startup latency; 0 skips it (default: 10)")
+    parser.add_argument("--startup-only", action="store_true", help="only measure startup latency")
+    parser.add_argument("--scaling", type=int, metavar="N",
+                        help="measure numpy speedup from 1 to N threads on the largest size")
+    parser.add_argument("--calibrate", action="store_true",
+                        help="measure per-pixel filter costs for the recipe planner and store them")
+    parser.add_argument("--threads", type=int, default=1, help="numpy threads for --calibrate (default: 1)")
+    parser.add_argument("--save", metavar="FILE", help="write results as JSON")
+    parser.add_argument("--baseline", metavar="FILE", help="compare against a saved JSON result")
+    parser.add_argument("--threshold", type=float, default=0.2, help="slowdown ratio flagged as a regression (default: 0.2)")
+    args = parser.parse_args(argv)
+
+    backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+    for backend in backends:
+        if backend not in F.BACKENDS:
+            parser.error(f"unknown backend {backend!r}")
+    try:
+        sizes = parse_sizes(args.sizes)
+    except ValueError:
+        parser.error(f"invalid --sizes {args.sizes!r}; expected e.g. 512x512,1024x768")
+
+    if args.scaling is not None:
+        if args.scaling < 1:
+            parser.error("--scaling must be at least 1")
+        if not F.HAVE_NUMPY:
+            parser.error("--scaling requires NumPy")
+
+    if args.calibrate:
+        import recipes
+        if args.threads < 1:
+            parser.error("--threads must be at least 1")
+        F.set_threads(args.threads)
+        for backend in backends:
+            recipes.save_costs(backend, run_calibration(backend, args.repeat), args.threads)
+        print(_col("Saved costs to", GREEN), _col(recipes.COSTS_FILE, BOLD))
+        return 0
+
+    results = []
+    if args.scaling:
+        results += run_scaling(max(sizes, key=lambda s: s[0] * s[1]), args.scaling, args.repeat)
+    elif args.startup_runs > 0 or args.startup_only:
+        results.append(run_startup(max(args.startup_runs, 1)))
+    if not args.startup_only and not args.scaling:
+        print_header()
+        results += run(sizes, backends, args.repeat, args.reference_max_mp)
+    report = {"meta": metadata(), "results": results}
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+        print(_col("Saved results to", GREEN), _col(args.save, BOLD))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(_col("\nComparing with", CYAN), _col(args.baseline, BOLD))
+        if compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
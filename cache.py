@@ -0,0 +1,166 @@
+"""
+cache.py - Content-addressed on-disk cache for filter chain results.
+
+Entries are keyed on a hash of the input pixels plus the normalized chain
+(filter names, their parameters and the border mode). The result after
+every step is stored, not only the final image, so `sepia,smoothing` can
+start from a cached `sepia`. The cache is bounded in size and evicts the
+least recently used entries first (file modification time records use).
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+
+import functions as F
+import interface
+from interface import _col, BOLD, CYAN, GREEN
+
+DEFAULT_DIR = os.path.join(os.path.expanduser("~"), ".cache", "image_treatment")
+DEFAULT_MAX_MB = 1024
+
+# Bump when the entry format or any filter's output changes
+CACHE_VERSION = 1
+
+_SUFFIX = ".img"
+
+
+def image_digest(img) -> str:
+    """Return a hex digest of an image's mode, size, palette and pixel data."""
+    h = hashlib.sha256()
+    h.update(f"{img.mode} {img.size[0]}x{img.size[1]}".encode("ascii"))
+    if img.mode == "P":
+        h.update(bytes(img.getpalette() or []))
+    h.update(img.tobytes())
+    return h.hexdigest()
+
+
+def chain_key(digest: str, stages) -> str:
+    """Return the cache key for applying (name, func, params) stages to an image digest."""
+    chain = [[func.__name__, sorted(params.items())] for _, func, params in stages]
+    payload = json.dumps([CACHE_VERSION, digest, F.border, chain])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """Directory of cached images, bounded to max_bytes with LRU eviction."""
+
+    def __init__(self, directory: str = DEFAULT_DIR, max_mb: float = DEFAULT_MAX_MB):
+        self.directory = directory
+        self.max_bytes = int(max_mb * 1e6)
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + _SUFFIX)
+
+    def get(self, key: str):
+        """Return the cached image for key, or None. Marks the entry as recently used."""
+        from PIL import Image
+
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                header = json.loads(f.readline())
+                data = f.read()
+            img = Image.frombytes(header["mode"], tuple(header["size"]), data)
+            if "palette" in header:
+                img.putpalette(header["palette"])
+            os.utime(path)
+            return img
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def put(self, key: str, img):
+        """Store img under key, writing atomically."""
+        header = {"mode": img.mode, "size": list(img.size)}
+        if img.mode == "P":
+            header["palette"] = img.getpalette()
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(json.dumps(header).encode("utf-8") + b"\n")
+                f.write(img.tobytes())
+            os.replace(tmp, self._path(key))
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def entries(self):
+        """Return (path, size, last_used) for every entry, oldest first."""
+        found = []
+        for name in os.listdir(self.directory):
+            if name.endswith(_SUFFIX):
+                path = os.path.join(self.directory, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                found.append((path, st.st_size, st.st_mtime))
+        return sorted(found, key=lambda e: e[2])
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits max_bytes."""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+    def purge(self) -> int:
+        """Delete every entry. Returns the number removed."""
+        removed = 0
+        for path, _, _ in self.entries():
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                pass
+        return removed
+
+    def show_info(self):
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        print(_col("Cache:", GREEN), _col(self.directory, BOLD))
+        print(_col("Entries:", CYAN), len(entries))
+        print(_col("Size:", CYAN), f"{total / 1e6:.1f} MB of {self.max_bytes / 1e6:.1f} MB")
+
+    def run(self, steps):
+        """Apply planned steps to the current image, reusing the longest cached prefix.
+
+        Returns the steps that were applied, cached ones included.
+        """
+        stages = [stage for step in steps for stage in step]
+        if not stages:
+            return []
+        digest = image_digest(F.img)
+        keys = [chain_key(digest, stages[:k]) for k in range(1, len(stages) + 1)]
+
+        done = 0
+        for k in range(len(stages), 0, -1):
+            cached = self.get(keys[k - 1])
+            if cached is not None:
+                F.img = cached
+                done = k
+                names = [name for name, _, _ in stages[:k]]
+                interface.record_history(names)
+                print(_col("Cached:", GREEN), _col(", ".join(names), BOLD))
+                break
+
+        applied = interface.group_stages(stages[:done])
+        caching = True
+        for step in interface.group_stages(stages[done:]):
+            ok = interface._run_steps([step])
+            applied += ok
+            # A failed step means later prefixes no longer match their keys
+            caching = caching and bool(ok)
+            done += len(step)
+            if caching:
+                self.put(keys[done - 1], F.img)
+        self.evict()
+        return applied
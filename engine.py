@@ -0,0 +1,500 @@
+"""
+engine.py - NumPy backend for the filters in `functions.py`.
+
+Point filters are described either as per-channel 256-entry lookup tables
+(`ChannelLUT`) or as 3x3 colour matrices (`ColorMatrix`) and applied to the
+whole image at once. Results match the reference getpixel/putpixel loops
+exactly: values are rounded half-to-even like `round()` and clamped to 0-255
+like `functions._clamp`.
+
+Neighbourhood filters go through `convolve`, which reads from the source
+array and writes to a separate destination so results do not depend on
+iteration order.
+
+Work is split into horizontal bands of rows. With `set_threads(n)` the bands
+run on a shared thread pool; NumPy releases the GIL inside its array loops,
+so bands of one image are processed on several cores at once.
+"""
+
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+# Rows processed per step by `apply_point`; bounds the float temporaries
+# that colour matrices need on very large images.
+STRIP_ROWS = 256
+
+_VALUES = np.arange(256, dtype=np.float64)
+
+# Threads used for band-parallel work; 1 runs every band on the calling thread.
+threads = 1
+_pool = None
+
+
+def set_threads(n: int):
+    """Set the number of threads that process bands of one image."""
+    global threads, _pool
+    n = int(n)
+    if n < 1:
+        raise ValueError(f"Thread count must be at least 1, got {n}")
+    if n != threads and _pool is not None:
+        _pool.shutdown()
+        _pool = None
+    threads = n
+
+
+def for_bands(height: int, work, rows: int = STRIP_ROWS, align: int = 1):
+    """Call work(y0, y1) for consecutive bands of rows covering [0, height).
+
+    Bands hold at most `rows` rows, fewer when that leaves a band for every
+    thread, and are rounded down to a multiple of `align` (never below it).
+    Bands must write disjoint rows; they run on the thread pool when
+    `threads` > 1 and any exception is re-raised here.
+    """
+    global _pool
+    if threads > 1:
+        rows = min(rows, -(-height // threads))
+    rows = max(align, rows // align * align)
+    bands = [(y0, min(y0 + rows, height)) for y0 in range(0, height, rows)]
+    if threads == 1 or len(bands) == 1:
+        for y0, y1 in bands:
+            work(y0, y1)
+        return
+    if _pool is None:
+        _pool = ThreadPoolExecutor(threads, thread_name_prefix="band")
+    for _ in _pool.map(lambda band: work(*band), bands):
+        pass
+
+
+def clamp_round(values):
+    """Round half-to-even and clamp to 0-255, returning a uint8 array."""
+    return np.clip(np.rint(values), 0, 255).astype(np.uint8)
+
+
+def to_array(img):
+    """Return an HxWxC uint8 copy of an image's colour channels.
+
+    C is 1 for L and LA images and 3 for RGB and RGBA; alpha is left out.
+    """
+    if img.mode not in ("L", "LA", "RGB", "RGBA"):
+        raise ValueError(f"Unsupported image mode {img.mode!r}; expected L, LA, RGB or RGBA")
+    if img.mode in ("LA", "RGBA"):
+        img = img.convert(img.mode[:-1])
+    arr = np.array(img, dtype=np.uint8)
+    return arr.reshape(arr.shape[0], arr.shape[1], -1)
+
+
+def from_array(img, arr):
+    """Write an HxWxC uint8 array back into img's colour channels in place, keeping its alpha."""
+    out = Image.fromarray(arr[..., 0] if arr.shape[2] == 1 else arr)
+    if img.mode in ("LA", "RGBA"):
+        out.putalpha(img.getchannel("A"))
+    img.paste(out)
+    forget_histograms(img)
+
+
+class ChannelLUT:
+    """Point operation where output channel c is luts[c][input channel src[c]]."""
+
+    def __init__(self, luts, src=(0, 1, 2)):
+        self.luts = np.asarray(luts, dtype=np.uint8).reshape(3, 256)
+        self.src = tuple(int(s) for s in src)
+
+    @classmethod
+    def from_funcs(cls, *funcs):
+        """Build a LUT from one function per channel (or one for all three)."""
+        if len(funcs) == 1:
+            funcs = funcs * 3
+        return cls([clamp_round([f(v) for v in range(256)]) for f in funcs])
+
+    def then(self, other):
+        """Return the single LUT equivalent to applying self and then other."""
+        src = [self.src[s] for s in other.src]
+        luts = [other.luts[c][self.luts[other.src[c]]] for c in range(3)]
+        return ChannelLUT(luts, src)
+
+    def apply(self, arr):
+        out = np.empty_like(arr)
+        for c in range(arr.shape[2]):
+            np.take(self.luts[c], arr[..., self.src[c]], out=out[..., c])
+        return out
+
+
+class ColorMatrix:
+    """Point operation computing each output channel as a weighted sum of R, G, B.
+
+    Optional `pre` and `post` ChannelLUTs are applied before and after the
+    matrix; `fuse` uses them to absorb neighbouring LUTs into a single pass.
+    """
+
+    def __init__(self, matrix, pre=None, post=None):
+        self.matrix = np.asarray(matrix, dtype=np.float64).reshape(3, 3)
+        self.pre = pre
+        self.post = post
+
+    def as_lut(self):
+        """Return an equivalent ChannelLUT if every row reads at most one channel."""
+        luts, src = [], []
+        for row in self.matrix:
+            nonzero = np.flatnonzero(row)
+            if len(nonzero) > 1:
+                return None
+            k = int(nonzero[0]) if len(nonzero) else 0
+            luts.append(clamp_round(row[k] * _VALUES))
+            src.append(k)
+        lut = ChannelLUT(luts, src)
+        if self.pre is not None:
+            lut = self.pre.then(lut)
+        if self.post is not None:
+            lut = lut.then(self.post)
+        return lut
+
+    def apply(self, arr):
+        lut = self.as_lut()
+        if lut is not None:
+            return lut.apply(arr)
+        if self.pre is None:
+            channels = [arr[..., k].astype(np.float64) for k in range(3)]
+        out = np.empty_like(arr)
+        for c, weights in enumerate(self.matrix):
+            if self.pre is None:
+                terms = [weights[k] * channels[k] for k in range(3)]
+            else:
+                # weight * pre_lut[v] looked up from a table is the same float as
+                # multiplying the intermediate image, without materializing it
+                terms = [
+                    (weights[k] * self.pre.luts[k].astype(np.float64))[arr[..., self.pre.src[k]]]
+                    for k in range(3)
+                ]
+            # Same summation order as the reference loops so floats match exactly
+            out[..., c] = clamp_round(terms[0] + terms[1] + terms[2])
+        if self.post is not None:
+            out = self.post.apply(out)
+        return out
+
+
+def fuse(ops):
+    """Compose a run of point operations into as few operations as possible.
+
+    Adjacent LUTs compose into one LUT and LUTs on either side of a colour
+    matrix fold into it; only two true matrices in a row stay separate, since
+    the intermediate rounding between them cannot be skipped exactly.
+    """
+    fused = []
+    for op in ops:
+        if isinstance(op, ColorMatrix):
+            op = op.as_lut() or op
+        prev = fused[-1] if fused else None
+        if isinstance(op, ChannelLUT):
+            if isinstance(prev, ChannelLUT):
+                fused[-1] = prev.then(op)
+                continue
+            if isinstance(prev, ColorMatrix):
+                post = op if prev.post is None else prev.post.then(op)
+                fused[-1] = ColorMatrix(prev.matrix, prev.pre, post)
+                continue
+        elif isinstance(prev, ChannelLUT) and op.pre is None:
+            fused[-1] = ColorMatrix(op.matrix, prev, op.post)
+            continue
+        fused.append(op)
+    return fused
+
+
+def apply_point(img, ops):
+    """Apply one point operation, or a fused list of them, to an image in place."""
+    if not isinstance(ops, (list, tuple)):
+        ops = [ops]
+    ops = fuse(ops)
+    hist = cached_histograms(img)
+    arr = to_array(img)
+    if arr.shape[2] == 1:
+        # A single-channel image stands for R = G = B, so the whole chain
+        # reduces to the LUT it produces on a gray ramp
+        ramp = np.repeat(np.arange(256, dtype=np.uint8), 3).reshape(256, 1, 3)
+        for op in ops:
+            ramp = op.apply(ramp)
+        ops = [ChannelLUT([ramp[:, 0, 0]] * 3)]
+
+    def work(y0, y1):
+        strip = arr[y0:y1]
+        for op in ops:
+            strip[...] = op.apply(strip)
+
+    for_bands(arr.shape[0], work)
+    from_array(img, arr)
+    if hist is not None and len(ops) == 1 and isinstance(ops[0], ChannelLUT):
+        # A LUT moves whole histogram bins, so the new histogram needs no rescan
+        _remember(img, remap_histograms(hist, ops[0]))
+
+
+### Convolution ###
+
+# Border modes understood by `convolve`, mapped to their np.pad names.
+_PAD_MODES = {"edge": "edge", "reflect": "reflect", "wrap": "wrap", "constant": "constant"}
+
+
+def pad(arr, top, bottom, left, right, border="edge"):
+    """Pad the first two axes of arr using one of the convolution border modes."""
+    if border not in _PAD_MODES:
+        raise ValueError(f"Unknown border mode {border!r}; choose from: {', '.join(_PAD_MODES)}")
+    widths = ((top, bottom), (left, right)) + ((0, 0),) * (arr.ndim - 2)
+    return np.pad(arr, widths, mode=_PAD_MODES[border])
+
+
+def separate(kernel):
+    """Return (column, row) 1-D factors if kernel is their outer product, else None."""
+    kernel = np.asarray(kernel, dtype=np.float64)
+    if not kernel.any():
+        return None
+    py, px = np.unravel_index(np.argmax(np.abs(kernel)), kernel.shape)
+    column = kernel[:, px]
+    row = kernel[py, :] / kernel[py, px]
+    if not np.allclose(np.outer(column, row), kernel, rtol=1e-12, atol=1e-12):
+        return None
+    return column, row
+
+
+def _correlate(window, kernel, factors):
+    """Correlate a padded window with kernel, returning the valid region as floats."""
+    kh, kw = kernel.shape
+    rows = window.shape[0] - kh + 1
+    cols = window.shape[1] - kw + 1
+    if factors is None:
+        acc = np.zeros((rows, cols) + window.shape[2:])
+        for ky in range(kh):
+            for kx in range(kw):
+                weight = kernel[ky, kx]
+                if weight:
+                    acc += weight * window[ky:ky + rows, kx:kx + cols]
+        return acc
+    column, row = factors
+    tmp = np.zeros((window.shape[0], cols) + window.shape[2:])
+    for kx, weight in enumerate(row):
+        if weight:
+            tmp += weight * window[:, kx:kx + cols]
+    acc = np.zeros((rows, cols) + window.shape[2:])
+    for ky, weight in enumerate(column):
+        if weight:
+            acc += weight * tmp[ky:ky + rows]
+    return acc
+
+
+def convolve(src, kernel, border="edge"):
+    """Correlate a uint8 image array with kernel and return a new array.
+
+    src is only read, so every output pixel is computed from original
+    neighbours. The kernel is anchored at (kh // 2, kw // 2); pixels outside
+    the image come from `border`. Separable kernels run as two 1-D passes.
+    Each band reads kh - 1 overlap rows of the padded source around it.
+    """
+    kernel = np.asarray(kernel, dtype=np.float64)
+    kh, kw = kernel.shape
+    padded = pad(src, kh // 2, kh - 1 - kh // 2, kw // 2, kw - 1 - kw // 2, border)
+    factors = separate(kernel)
+    dst = np.empty_like(src)
+
+    def work(y0, y1):
+        dst[y0:y1] = clamp_round(_correlate(padded[y0:y1 + kh - 1], kernel, factors))
+
+    for_bands(src.shape[0], work)
+    return dst
+
+
+def apply_kernel(img, kernel, border="edge"):
+    """Convolve an RGB image with kernel in place."""
+    from_array(img, convolve(to_array(img), kernel, border))
+
+
+### Box operations ###
+
+def integral_image(arr):
+    """Return the summed-area table of a uint8 array, with a leading zero row and column.
+
+    sat[y, x] holds the per-channel sum of arr[:y, :x], so the sum over any
+    box costs four lookups (see `box_sum`). Small images use uint32; the
+    wrap-around in `box_sum` then cancels out exactly.
+    """
+    h, w = arr.shape[:2]
+    dtype = np.uint32 if 255 * h * w < 2 ** 32 else np.int64
+    sat = np.zeros((h + 1, w + 1) + arr.shape[2:], dtype=dtype)
+    np.cumsum(arr, axis=0, dtype=dtype, out=sat[1:, 1:])
+    np.cumsum(sat[1:, 1:], axis=1, dtype=dtype, out=sat[1:, 1:])
+    return sat
+
+
+def box_sum(sat, y0, x0, y1, x1):
+    """Sum over rows [y0, y1) and columns [x0, x1); bounds may be index arrays or slices."""
+    return sat[y1, x1] - sat[y0, x1] - sat[y1, x0] + sat[y0, x0]
+
+
+def block_mean(src, block):
+    """Replace every block x block cell of a uint8 array with its floored mean.
+
+    Cells that overhang the right or bottom edge repeat the last column/row,
+    like the clamped reads of the reference loop. Rows are processed in
+    block-aligned bands so the summed-area table stays small.
+    """
+    h, w = src.shape[:2]
+    dst = np.empty_like(src)
+    cells = slice(None, -1), slice(1, None)
+
+    def work(y0, y1):
+        rows = src[y0:y1]
+        padded = pad(rows, 0, -len(rows) % block, 0, -w % block, "edge")
+        grid = integral_image(padded)[::block, ::block]
+        sums = box_sum(grid, cells[0], cells[0], cells[1], cells[1])
+        means = (sums // (block * block)).astype(np.uint8)
+        filled = np.repeat(np.repeat(means, block, axis=0), block, axis=1)
+        dst[y0:y1] = filled[:len(rows), :w]
+
+    for_bands(h, work, align=block)
+    return dst
+
+
+def apply_block_mean(img, block):
+    """Pixelate an image in place."""
+    from_array(img, block_mean(to_array(img), block))
+
+
+def window_sums(arr, radius, axis=0, border="edge", peak=255):
+    """Sum arr[i - radius : i + radius + 1] along `axis` for every i.
+
+    Indices outside the array follow `border` without padding it: the prefix
+    sum of the array (of its mirrored period for "reflect") is extended by
+    whole periods for "reflect"/"wrap", by repeated edge values for "edge"
+    and by zeros for "constant". Only windows that reach past an edge need
+    that; cost and memory do not depend on the radius. `peak` bounds the
+    values of arr and picks the accumulator type.
+    """
+    if border not in _PAD_MODES:
+        raise ValueError(f"Unknown border mode {border!r}; choose from: {', '.join(_PAD_MODES)}")
+    n = arr.shape[axis]
+    if border == "reflect" and n > 1:
+        base = np.concatenate([arr, np.flip(arr, axis).take(np.arange(1, n - 1), axis)], axis)
+    else:
+        base = arr
+    period = base.shape[axis]
+    dtype = np.int32 if peak * (period + 2 * radius + 2) < 2 ** 31 else np.int64
+    shape = list(arr.shape)
+    shape[axis] = period + 1
+    prefix = np.zeros(shape, dtype=dtype)
+    along = lambda part: (slice(None),) * axis + (part,)
+    np.cumsum(base, axis=axis, dtype=dtype, out=prefix[along(slice(1, None))])
+    sums = np.empty(arr.shape, dtype=dtype)
+    # Windows that lie inside the array
+    lo = min(radius, n)
+    hi = max(lo, n - radius)
+    sums[along(slice(lo, hi))] = prefix[along(slice(lo + radius + 1, hi + radius + 1))] \
+        - prefix[along(slice(lo - radius, hi - radius))]
+    edges = np.r_[0:lo, hi:n]
+    if not len(edges):
+        return sums
+    # Lines an index vector up with `axis` of the arrays taken from
+    at = (slice(None),) + (None,) * (arr.ndim - axis - 1)
+
+    def extended(k):
+        # Prefix sum up to index k of the border-extended array
+        if border in ("reflect", "wrap"):
+            turns, rest = np.divmod(k, period)
+            return prefix.take(rest, axis) + turns[at] * prefix.take([period], axis)
+        inside = prefix.take(np.clip(k, 0, n), axis)
+        if border == "edge":
+            inside += np.minimum(k, 0)[at] * arr.take([0], axis).astype(dtype)
+            inside += np.maximum(k - n, 0)[at] * arr.take([n - 1], axis).astype(dtype)
+        return inside
+
+    sums[along(edges)] = extended(edges + radius + 1) - extended(edges - radius)
+    return sums
+
+
+def box_blur(src, radius, border="edge"):
+    """Return the mean of every (2 * radius + 1)-square window of a uint8 array.
+
+    The window sums are separable: `window_sums` runs along each row, then
+    down each column, so a pixel costs the same whatever the radius and no
+    padded copy is made. The mean is rounded like `clamp_round`, so radius 1
+    matches convolving with the 3x3 average kernel.
+    """
+    h, w = src.shape[:2]
+    size = 2 * radius + 1
+    across = np.empty(src.shape, dtype=np.uint16 if 255 * size < 2 ** 16 else np.uint32)
+    dst = np.empty_like(src)
+
+    def rows(y0, y1):
+        across[y0:y1] = window_sums(src[y0:y1], radius, 1, border)
+
+    def columns(x0, x1):
+        sums = window_sums(across[:, x0:x1], radius, 0, border, peak=255 * size)
+        dst[:, x0:x1] = clamp_round(sums / (size * size))
+
+    for_bands(h, rows)
+    # Column bands hold every row, so they are kept narrow
+    for_bands(w, columns, rows=max(1, STRIP_ROWS * STRIP_ROWS // h))
+    return dst
+
+
+def apply_box_blur(img, radius, passes=1, border="edge"):
+    """Box-blur an image in place, repeating the pass `passes` times."""
+    arr = to_array(img)
+    for _ in range(passes):
+        arr = box_blur(arr, radius, border)
+    from_array(img, arr)
+
+
+### Histograms ###
+
+# Per-channel histograms of images, keyed by id() and dropped when the image
+# is written to through from_array or garbage collected.
+_histograms = {}
+
+
+def channel_histograms(arr):
+    """Return a Cx256 int64 array counting every value of each channel of arr.
+
+    Each band is counted in one pass over all channels by offsetting
+    channel c into bins [256 * c, 256 * c + 256).
+    """
+    channels = arr.shape[2]
+    offsets = np.arange(channels, dtype=np.uint16) * 256
+    partials = {}
+
+    def work(y0, y1):
+        partials[y0] = np.bincount((arr[y0:y1] + offsets).ravel(), minlength=256 * channels)
+
+    for_bands(arr.shape[0], work)
+    return sum(partials.values(), np.zeros(256 * channels, dtype=np.int64)).reshape(channels, 256)
+
+
+def _remember(img, hist):
+    _histograms[id(img)] = (weakref.ref(img, lambda _, key=id(img): _histograms.pop(key, None)), hist)
+
+
+def cached_histograms(img):
+    """Return the cached histograms of img, or None."""
+    entry = _histograms.get(id(img))
+    if entry is not None and entry[0]() is img:
+        return entry[1]
+    return None
+
+
+def histograms(img):
+    """Return the Cx256 histograms of an image's colour channels, scanning it only if not cached."""
+    hist = cached_histograms(img)
+    if hist is None:
+        hist = channel_histograms(to_array(img))
+        _remember(img, hist)
+    return hist
+
+
+def forget_histograms(img):
+    _histograms.pop(id(img), None)
+
+
+def remap_histograms(hist, lut):
+    """Return the histograms of an image after applying lut, given those from before."""
+    return np.stack([
+        np.bincount(lut.luts[c], weights=hist[lut.src[c]], minlength=256).astype(np.int64)
+        for c in range(len(hist))
+    ])
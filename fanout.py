@@ -0,0 +1,170 @@
+"""
+fanout.py - Write several filtered variants of one image in a single run.
+
+Each output has its own chain. The input is decoded once and the chains are
+merged into a prefix tree, so stages that several chains start with run
+only once. The image is copied only where chains part ways; the last
+branch at each fork takes over the image without a copy. Runs of
+per-pixel filters between forks are still fused into one pass.
+
+    python main.py -i photo.jpg -f grayscale --fanout thumb.png="pixelate" --fanout soft.png="smoothing (blur)"
+"""
+
+import os
+import time
+
+import formats
+import functions as F
+import interface
+from interface import _col, BOLD, CYAN, GREEN, RED, YELLOW
+
+
+class _Node:
+    """A stage in the prefix tree, with the outputs that end after it and the stages that follow."""
+
+    def __init__(self, stage=None):
+        self.stage = stage
+        # Keyed by stage name and parameters, in the order chains were given
+        self.children = {}
+        self.outputs = []
+
+    def count_outputs(self) -> int:
+        return len(self.outputs) + sum(child.count_outputs() for child in self.children.values())
+
+
+def _key(stage):
+    name, _, params = stage
+    return name, tuple(sorted(params.items()))
+
+
+def build_tree(chains):
+    """Merge (output, stages) chains into a prefix tree. Returns the root node."""
+    root = _Node()
+    for output, stages in chains:
+        node = root
+        for stage in stages:
+            node = node.children.setdefault(_key(stage), _Node(stage))
+        node.outputs.append(output)
+    return root
+
+
+def segments(node):
+    """Return (stages, end) for each branch below node.
+
+    A branch runs until the next fork or output, so its stages can be
+    applied in one go; `end` is the node it stops at.
+    """
+    result = []
+    for child in node.children.values():
+        stages, end = [child.stage], child
+        while not end.outputs and len(end.children) == 1:
+            end = next(iter(end.children.values()))
+            stages.append(end.stage)
+        result.append((stages, end))
+    return result
+
+
+def _stage_count(node) -> int:
+    return sum(1 + _stage_count(child) for child in node.children.values())
+
+
+def check_outputs(chains):
+    """Raise ValueError if two chains would write the same file (after a forced --format)."""
+    seen = {}
+    for output, _ in chains:
+        key = os.path.normcase(os.path.abspath(formats.output_path(output)))
+        if key in seen:
+            raise ValueError(f"{seen[key]} and {output} would both be written to {formats.output_path(output)}")
+        seen[key] = output
+
+
+def plan_fanout(chains, shared_tokens=()):
+    """Plan (output, tokens) chains, prompting for parameters. Returns (root, unshared_stage_count).
+
+    shared_tokens start every chain; they are prompted for only once.
+    """
+    shared = interface.resolve_tokens(shared_tokens)
+    planned = []
+    for output, tokens in chains:
+        print(_col("Planning", YELLOW), _col(output, BOLD), _col("...", YELLOW))
+        planned.append((output, interface.plan_stages(shared + interface.resolve_tokens(tokens))))
+    return build_tree(planned), sum(len(stages) for _, stages in planned)
+
+
+def _run(img, node, written):
+    for output in node.outputs:
+        try:
+            saved = formats.save(img, output)
+            written.append(saved)
+            print(_col("Saved", GREEN), _col(saved[0], BOLD), _col(f"({formats.describe(*saved[1:])})", CYAN))
+        except Exception as e:
+            print(_col("Failed to save", RED), _col(output, BOLD), "->", _col(str(e), RED))
+    branches = segments(node)
+    for k, (stages, end) in enumerate(branches):
+        # The last branch takes the image over; earlier ones work on a copy
+        branch = img if k == len(branches) - 1 else img.copy()
+        label = ", ".join(name for name, _, _ in stages)
+        shared = end.count_outputs()
+        print(_col("Applying:", YELLOW), _col(label, BOLD),
+              _col(f"(for {shared} outputs) ..." if shared > 1 else "...", YELLOW))
+        try:
+            interface.apply_steps(branch, interface.group_stages(stages))
+        except Exception as e:
+            print(_col("Error applying", RED), _col(label, BOLD), _col("->", RED), _col(str(e), RED))
+            continue
+        _run(branch, end, written)
+
+
+def run_fanout(input_filename: str, chains, shared_tokens=()):
+    """Decode input_filename once and write every (output, tokens) chain. Returns the saved outputs."""
+    root, unshared = plan_fanout(chains, shared_tokens)
+    try:
+        img = formats.open_image(input_filename)
+    except Exception as e:
+        print(_col("Failed to open:", RED), _col(input_filename, BOLD), "->", _col(str(e), RED))
+        return []
+    w, h = img.size
+    print(_col("Loaded image:", GREEN), _col(input_filename, BOLD), _col(f"({w}x{h})", CYAN))
+    start = time.perf_counter()
+    written = []
+    _run(img, root, written)
+    elapsed = time.perf_counter() - start
+    runs = _stage_count(root)
+    print(_col("Done:", GREEN), f"{len(written)}/{root.count_outputs()} outputs in {elapsed:.2f}s;",
+          f"{runs} stage runs instead of {unshared}")
+    return written
+
+
+def print_plan(path: str, root, unshared: int):
+    """Print the prefix tree with estimated times, without running it."""
+    import recipes
+
+    costs, source = recipes.load_costs()
+    size, gray, _ = recipes.probe(path)
+    print(_col("Fan-out plan for", GREEN), _col(path, BOLD), _col(f"({size[0]}x{size[1]})", CYAN))
+    total = _print_branches(root, size, gray, costs, 1)
+    # The same chains run one by one would repeat every shared stage
+    print(_col("Stage runs:", CYAN), f"{_stage_count(root)} instead of {unshared}")
+    print(_col("Estimated time:", GREEN), _col(recipes._seconds(total), BOLD),
+          f"({F.backend} backend, {source})")
+
+
+def _print_branches(node, size, gray, costs, depth) -> float:
+    import recipes
+
+    total = 0.0
+    for stages, end in segments(node):
+        steps = interface.group_stages(stages)
+        seconds = sum(s for s, _ in recipes.estimate(steps, size, gray, costs))
+        total += seconds
+        label = ", ".join(name for name, _, _ in stages)
+        outputs = f"-> {', '.join(end.outputs)}" if end.outputs else ""
+        print(f"{'  ' * depth}{label:<{44 - 2 * depth}} {recipes._seconds(seconds):>10}  {outputs}".rstrip())
+        branch_gray = gray
+        for _, func, _ in stages:
+            if func.__name__ == "grayscale":
+                branch_gray = True
+            elif F.adds_colour(func):
+                branch_gray = False
+        total += _print_branches(end, size, branch_gray, costs, depth + 1)
+    return total
@@ -0,0 +1,202 @@
+"""
+formats.py - Encoder settings for saved images and a raw intermediate format.
+
+`save` writes an image with the options chosen by `set_save_options`
+(format, JPEG/WebP quality, optimize/progressive, PNG compression level)
+and returns how long encoding took and how large the file is.
+
+Binary PPM/PGM and NumPy `.npy` files are uncompressed intermediates: they
+encode at memory speed and `open_image` maps them into memory instead of
+decoding them, so a chain split over several runs loses no quality and
+reloads at memory speed. Single-channel and RGBA images wrap the mapping
+without copying (Pillow copies only when a filter first writes); RGB is
+copied once, since Pillow stores it padded to four bytes per pixel.
+"""
+
+import contextlib
+import os
+import tempfile
+import time
+
+import functions as F
+
+# Output format forced by set_save_options; None picks it from the extension
+save_format = None
+save_options = {}
+
+FORMATS = ("jpeg", "png", "webp", "tiff", "bmp", "ppm", "npy")
+
+# Extensions of each format; the first is used when renaming outputs
+_EXTENSIONS = {
+    "jpeg": (".jpg", ".jpeg"), "png": (".png",), "webp": (".webp",), "tiff": (".tif", ".tiff"),
+    "bmp": (".bmp",), "ppm": (".ppm", ".pgm"), "npy": (".npy",),
+}
+
+# Options each Pillow encoder understands; others are not passed to it
+_ENCODER_OPTIONS = {
+    "JPEG": ("quality", "optimize", "progressive"),
+    "PNG": ("optimize", "compress_level"),
+    "WEBP": ("quality",),
+}
+
+# Modes encoders can store, for those that cannot store every filter mode.
+# Alpha is kept when the encoder allows it and dropped otherwise.
+_ENCODER_MODES = {
+    "JPEG": ("L", "RGB"),
+    "PPM": ("L", "RGB"),
+    "BMP": ("L", "RGB", "RGBA"),
+}
+
+RAW_EXTENSIONS = (".npy", ".ppm", ".pgm")
+
+# Permissions new files get, applied to temporary files (created 0600) before they are renamed
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def set_save_options(format=None, quality=None, optimize=False, progressive=False, compress_level=None):
+    """Select the output format and encoder options used by save()."""
+    global save_format, save_options
+    if format is not None and format not in FORMATS:
+        raise ValueError(f"Unknown format {format!r}; choose from: {', '.join(FORMATS)}")
+    if quality is not None and not 1 <= quality <= 100:
+        raise ValueError("Quality must be between 1 and 100")
+    if compress_level is not None and not 0 <= compress_level <= 9:
+        raise ValueError("Compression level must be between 0 and 9")
+    options = {"quality": quality, "compress_level": compress_level,
+               "optimize": optimize or None, "progressive": progressive or None}
+    save_format = format
+    save_options = {name: value for name, value in options.items() if value is not None}
+
+
+def output_path(path: str) -> str:
+    """Return path with its extension replaced by the forced format's, if any."""
+    if save_format is None:
+        return path
+    stem, ext = os.path.splitext(path)
+    if ext.lower() in _EXTENSIONS[save_format]:
+        return path
+    return stem + _EXTENSIONS[save_format][0]
+
+
+def encoder_options(fmt: str):
+    """Return the configured options that the Pillow encoder fmt understands."""
+    return {name: value for name, value in save_options.items() if name in _ENCODER_OPTIONS.get(fmt, ())}
+
+
+def save(img, path: str):
+    """Encode img to path with the configured options. Returns (path, seconds, bytes).
+
+    The extension is replaced when a format is forced, so the returned path
+    is the one actually written. The file is replaced only once encoding is
+    complete, since img may still be mapped from it (see `replacing`).
+    """
+    from PIL import Image
+
+    path = output_path(path)
+    ext = os.path.splitext(path)[1].lower()
+    fmt = Image.registered_extensions().get(ext)
+    if fmt is None and ext != ".npy":
+        raise ValueError(f"unknown file extension: {ext}")
+    start = time.perf_counter()
+    with replacing(path) as temp:
+        if ext == ".npy":
+            import numpy as np
+            np.save(temp, np.asarray(img))
+        else:
+            options = encoder_options(fmt)
+            modes = _ENCODER_MODES.get(fmt)
+            if modes is not None and img.mode not in modes:
+                img = img.convert("RGBA" if "RGBA" in modes else img.mode[:-1])
+            img.save(temp, format=fmt, **options)
+    return path, time.perf_counter() - start, os.path.getsize(path)
+
+
+@contextlib.contextmanager
+def replacing(path: str):
+    """Yield a temporary path beside path, renamed over path when the block succeeds.
+
+    The file at path is never truncated, so it can still be memory-mapped as
+    the input being filtered. On error the temporary file is removed.
+    """
+    directory, name = os.path.split(path)
+    stem, ext = os.path.splitext(name)
+    fd, temp = tempfile.mkstemp(prefix=f".{stem}.", suffix=ext, dir=directory or ".")
+    os.close(fd)
+    try:
+        yield temp
+        os.chmod(temp, 0o666 & ~_UMASK)
+        os.replace(temp, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(temp)
+        raise
+
+
+def describe(seconds: float, size: int) -> str:
+    """Return e.g. '1.25 MB in 0.034s' for a save report."""
+    amount = f"{size / 1e6:.2f} MB" if size >= 1e6 else f"{size / 1e3:.1f} KB"
+    return f"{amount} in {seconds:.3f}s"
+
+
+### Memory-mapped inputs ###
+
+def read_pnm_header(f):
+    """Parse a binary PGM/PPM header. Returns (magic, width, height, maxval, data_offset)."""
+    tokens = []
+    while len(tokens) < 4:
+        line = f.readline()
+        if not line:
+            raise ValueError("Truncated PPM header")
+        tokens += line.split(b"#", 1)[0].split()
+    if tokens[0] not in (b"P5", b"P6") or len(tokens) != 4:
+        raise ValueError("Only binary PGM (P5) and PPM (P6) files can be mapped")
+    width, height, maxval = (int(t) for t in tokens[1:])
+    return tokens[0], width, height, maxval, f.tell()
+
+
+def _map_pnm(path: str):
+    import mmap
+    from PIL import Image
+
+    with open(path, "rb") as f:
+        magic, width, height, maxval, offset = read_pnm_header(f)
+        if maxval != 255:
+            return None
+        mode = "RGB" if magic == b"P6" else "L"
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    data = memoryview(mapped)[offset:offset + width * height * len(mode)]
+    return Image.frombuffer(mode, (width, height), data, "raw", mode, 0, 1)
+
+
+def _map_npy(path: str):
+    import numpy as np
+    from PIL import Image
+
+    data = np.load(path, mmap_mode="r")
+    modes = {1: "L", 2: "LA", 3: "RGB", 4: "RGBA"}
+    channels = 1 if data.ndim == 2 else data.shape[2] if data.ndim == 3 else None
+    if data.dtype != np.uint8 or channels not in modes:
+        raise ValueError("Expected an HxW or HxWxC (C = 1 to 4) uint8 array in " + path)
+    mode = modes[channels]
+    return Image.frombuffer(mode, (data.shape[1], data.shape[0]), data, "raw", mode, 0, 1)
+
+
+def open_image(path: str):
+    """Open and decode an image; .npy and 8-bit binary PPM/PGM files are memory-mapped instead.
+
+    Palette and other modes are converted to one the filters work on (see
+    functions.normalize_mode).
+    """
+    from PIL import Image
+
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".npy":
+        return _map_npy(path)
+    if ext in (".ppm", ".pgm"):
+        img = _map_pnm(path)
+        if img is not None:
+            return img
+    img = Image.open(path)
+    img.load()
+    return F.normalize_mode(img)
@@ -0,0 +1,159 @@
+"""
+frames.py - Filter every frame of animated GIF, PNG (APNG) and WebP files and multi-page TIFFs.
+
+Frames are decoded, filtered and handed to the encoder one at a time by a
+chain of generators, so the filter chain never holds more than a few frames
+at once. Frame durations and the loop count are kept. With `workers`,
+frames are filtered on a process pool while earlier ones are encoded.
+
+TIFF pages are written to disk as they arrive. Pillow's GIF, APNG and WebP
+encoders keep the frames they are given until the file is finished (the
+GIF encoder compares each frame with the previous ones; the others need
+the whole list up front), so for those outputs the filtered frames stay in
+memory until the save completes.
+"""
+
+import collections
+import os
+import time
+
+import batch
+import formats
+import functions as F
+import interface
+from interface import _col, BOLD, CYAN, GREEN, RED, YELLOW
+
+# Pillow formats that can store several frames
+MULTI_FRAME_FORMATS = ("GIF", "PNG", "TIFF", "WEBP")
+
+# Disposal that clears each frame to the background before the next one is
+# drawn. Frames are written whole, so their transparent areas must not show
+# the frame before.
+_CLEAR = {"GIF": 2, "PNG": 1}
+
+
+def is_animated(path: str) -> bool:
+    """Return True if the file at path holds more than one frame or page."""
+    from PIL import Image
+
+    try:
+        with Image.open(path) as img:
+            return getattr(img, "is_animated", False)
+    except OSError:
+        return False
+
+
+def read_frames(path: str):
+    """Yield every frame of the image at path, converted to a mode the filters support.
+
+    GIF and APNG frames come out composited, as they are shown on screen.
+    """
+    from PIL import Image
+
+    with Image.open(path) as img:
+        for index in range(getattr(img, "n_frames", 1)):
+            img.seek(index)
+            yield F.normalize_mode(img.copy())
+
+
+def _filter_frame(frame, steps):
+    interface.apply_steps(frame, steps)
+    return frame
+
+
+def filter_frames(frames, steps, workers: int = None):
+    """Yield frames after applying steps to each, in order.
+
+    With more than one worker, frames are filtered on a process pool; at most
+    two per worker are in flight, so memory stays bounded.
+    """
+    if not workers or workers <= 1:
+        for frame in frames:
+            yield _filter_frame(frame, steps)
+        return
+    from multiprocessing import Pool
+
+    with Pool(workers, initializer=batch._init_worker, initargs=batch.worker_settings(1)) as pool:
+        pending = collections.deque()
+        for frame in frames:
+            pending.append(pool.apply_async(_filter_frame, (frame, steps)))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+
+
+def save_frames(frames, path: str):
+    """Encode an iterable of frames into one file. Returns (path, frame_count, pixels, bytes).
+
+    The extension is replaced when a format is forced, so the returned path
+    is the one actually written.
+    """
+    from PIL import Image, TiffImagePlugin
+
+    path = formats.output_path(path)
+    fmt = Image.registered_extensions().get(os.path.splitext(path)[1].lower())
+    if fmt not in MULTI_FRAME_FORMATS:
+        raise ValueError(f"{os.path.basename(path)} cannot hold several frames; save to .gif, .png, .tif or .webp")
+    counts = [0, 0]
+
+    def counted(images):
+        for img in images:
+            counts[0] += 1
+            counts[1] += img.size[0] * img.size[1]
+            yield img
+
+    frames = counted(frames)
+    options = formats.encoder_options(fmt)
+    # Frames may still be streaming from the file at path, so it is replaced only at the end
+    with formats.replacing(path) as temp:
+        if fmt == "TIFF":
+            with TiffImagePlugin.AppendingTiffWriter(temp, new=True) as tiff:
+                for frame in frames:
+                    frame.save(tiff, format="TIFF", **options)
+                    tiff.newFrame()
+        else:
+            first = next(frames)
+            rest = frames
+            if "loop" in first.info:
+                options["loop"] = first.info["loop"]
+            if fmt in _CLEAR and first.mode in ("LA", "RGBA"):
+                options["disposal"] = _CLEAR[fmt]
+            if fmt in ("PNG", "WEBP"):
+                # These encoders go through append_images twice, so it cannot be a generator
+                rest = list(rest)
+            if fmt == "WEBP":
+                # The WebP encoder only reads the first frame's duration by itself
+                options["duration"] = [img.info.get("duration", 0) for img in [first] + rest]
+            first.save(temp, format=fmt, save_all=True, append_images=rest, **options)
+    return path, counts[0], counts[1], os.path.getsize(path)
+
+
+def process_frames(path: str, out_path: str, steps, workers: int = None):
+    """Filter every frame of path into out_path. Returns (saved, frame_count, pixels).
+
+    saved is (output path, seconds, bytes) as from formats.save; the time
+    covers decoding and filtering too, since they run interleaved with encoding.
+    """
+    start = time.perf_counter()
+    written, count, pixels, size = save_frames(filter_frames(read_frames(path), steps, workers), out_path)
+    return (written, time.perf_counter() - start, size), count, pixels
+
+
+def run_frames(input_filename: str, output_filename: str, tokens, workers: int = None):
+    """Apply filter tokens to every frame of an animated or multi-page image. Returns True on success."""
+    steps = interface.plan_chain(tokens)
+    if not steps:
+        return False
+    names = [name for step in steps for name, _, _ in step]
+    print(_col("Applying:", YELLOW), _col(", ".join(names), BOLD),
+          _col("to every frame of", YELLOW), _col(input_filename, BOLD), _col("...", YELLOW))
+    try:
+        saved, count, _ = process_frames(input_filename, output_filename, steps, workers)
+    except Exception as e:
+        print(_col("Failed:", RED), _col(input_filename, BOLD), "->", _col(str(e), RED))
+        return False
+    interface.record_history(names)
+    print(_col("Saved final image as", GREEN), _col(saved[0], BOLD),
+          _col(f"({count} frames, {formats.describe(saved[1], saved[2])})", CYAN))
+    return True
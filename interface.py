@@ -7,58 +7,160 @@ via `-i/--input` or the interactive `-i <path>` command.
 """
 
 import argparse
-from PIL import Image
+import contextlib
+import importlib.util
+import os
+import formats
 import functions as F
+import preview as P
+import snapshots
 
 # Optional color support: prefer colorama when available (works on Windows).
-try:
-    import colorama
-    from colorama import Fore, Style
-
-    colorama.init()
-    RESET = Style.RESET_ALL
-    BOLD = Style.BRIGHT
-    RED = Fore.RED
-    GREEN = Fore.GREEN
-    YELLOW = Fore.YELLOW
-    BLUE = Fore.BLUE
-    MAGENTA = Fore.MAGENTA
-    CYAN = Fore.CYAN
-except Exception:
+# These are the ANSI codes colorama's Fore/Style use; colorama itself is only
+# imported and initialized the first time colored text is printed.
+if importlib.util.find_spec("colorama") is not None:
+    RESET = "\033[0m"
+    BOLD = "\033[1m"
+    RED = "\033[31m"
+    GREEN = "\033[32m"
+    YELLOW = "\033[33m"
+    BLUE = "\033[34m"
+    MAGENTA = "\033[35m"
+    CYAN = "\033[36m"
+else:
     # No coloring available — fall back to no-op strings
     RESET = BOLD = RED = GREEN = YELLOW = BLUE = MAGENTA = CYAN = ""
 
+_colorama_ready = False
+
 
 def _col(text: str, color: str = "") -> str:
     """Wrap text in color codes if available."""
+    global _colorama_ready
     if not color:
         return text
+    if not _colorama_ready:
+        _colorama_ready = True
+        try:
+            import colorama
+            colorama.init()
+        except Exception:
+            pass
     return f"{color}{text}{RESET}"
 
+class _LazyFilter:
+    """Registry entry for a filter in functions.py, looked up when first called."""
+
+    def __init__(self, name: str):
+        self.__name__ = name
+        self._func = None
+
+    def __call__(self, *args, **kwargs):
+        if self._func is None:
+            self._func = getattr(F, self.__name__)
+        return self._func(*args, **kwargs)
+
+    def __getstate__(self):
+        return self.__name__
+
+    def __setstate__(self, name):
+        self.__init__(name)
+
+    def __repr__(self):
+        return f"<filter {self.__name__}>"
+
+
 FILTERS = [
-    ("Grayscale", F.grayscale),
-    ("Negative", F.negative),
-    ("Red filter", F.red_filter),
-    ("Increase brightness", F.increase_brightness),
-    ("Decrease brightness", F.decrease_brightness),
-    ("Contrast", F.contrast),
-    ("Thresholding", F.thresholding),
-    ("Pixelate", F.pixelate),
-    ("Sepia", F.sepia),
-    ("Smoothing (blur)", F.smoothing),
-    ("Sharpen", F.sharpen),
-    ("Gradient (edge)", F.gradient),
+    ("Grayscale", _LazyFilter("grayscale")),
+    ("Negative", _LazyFilter("negative")),
+    ("Red filter", _LazyFilter("red_filter")),
+    ("Increase brightness", _LazyFilter("increase_brightness")),
+    ("Decrease brightness", _LazyFilter("decrease_brightness")),
+    ("Contrast", _LazyFilter("contrast")),
+    ("Thresholding", _LazyFilter("thresholding")),
+    ("Pixelate", _LazyFilter("pixelate")),
+    ("Sepia", _LazyFilter("sepia")),
+    ("Smoothing (blur)", _LazyFilter("smoothing")),
+    ("Sharpen", _LazyFilter("sharpen")),
+    ("Gradient (edge)", _LazyFilter("gradient")),
+    ("Auto contrast", _LazyFilter("auto_contrast")),
+    ("Otsu threshold", _LazyFilter("otsu_threshold")),
+    ("Equalize", _LazyFilter("equalize")),
 ]
 
-# Session history (recent applied filters) for the running session
+# Session history (recent applied filters) for the running session. Each entry
+# is {"name": ..., "profile": ...}; profile is the step's timing record when
+# profiling is enabled, else None.
 session_history = []
 
+# Optional on-disk result cache (see cache.py); enabled from main.py with --cache
+result_cache = None
+
+# Memory budget for the interactive undo/redo history (see snapshots.py)
+undo_budget_mb = snapshots.DEFAULT_BUDGET_MB
+
+# Start the interactive menu in proxy preview mode with this maximum side
+# (see preview.py); None starts at full resolution.
+preview_max_side = None
+
+# Path of the image currently loaded, used to decode preview proxies
+loaded_path = None
+
+# Let plan_chain reorder stages where that cannot change the result (see optimize_stages)
+reorder = True
+
+# Optional per-stage profiler (see profiling.py); enabled from main.py with --profile
+profiler = None
+trace_filename = None
+
+
+def record_history(names, profile=None):
+    """Append applied filter names to the session history."""
+    for name in names:
+        session_history.append({"name": name, "profile": profile})
+
+
+def _measure(kind: str, name: str, pixels: int = 0):
+    """Profile the enclosed block when profiling is enabled."""
+    if profiler is None:
+        return contextlib.nullcontext()
+    return profiler.measure(kind, name, pixels)
+
+
+def _pixels(img) -> int:
+    w, h = img.size
+    return w * h
+
+
+def _save_image(output_filename: str, label: str = "Saved result as"):
+    """Save the current image with the configured encoder and report it. Returns True on success."""
+    try:
+        with _measure("save", output_filename, _pixels(F.img)):
+            path, seconds, size = formats.save(F.img, output_filename)
+    except Exception as e:
+        print(_col("Failed to save result:", RED), _col(str(e), RED))
+        return False
+    print(_col(label, GREEN), _col(path, BOLD), _col(f"({formats.describe(seconds, size)})", CYAN))
+    return True
+
+
+def _finish_profile():
+    """Print the profile of the last chain and refresh the trace file, if enabled."""
+    if profiler is None:
+        return
+    profiler.report()
+    if trace_filename:
+        try:
+            profiler.write_trace(trace_filename)
+            print(_col("Trace written to", GREEN), _col(trace_filename, BOLD))
+        except OSError as e:
+            print(_col("Failed to write trace:", RED), _col(str(e), RED))
+
 
 def list_filters():
+    # Plain text: colouring would import and initialize colorama on `--list`
     for i, (name, _) in enumerate(FILTERS, 1):
-        num = _col(f"{i}.", CYAN)
-        nm = _col(name, BOLD)
-        print(f"{num} {nm}")
+        print(f"{i}. {name}")
 
 
 def show_menu(output_filename: str = None, show_commands: bool = True):
@@ -84,7 +186,7 @@ def show_menu(output_filename: str = None, show_commands: bool = True):
 
     # Recent actions
     if session_history:
-        recent = ", ".join(session_history[-8:])
+        recent = ", ".join(entry["name"] for entry in session_history[-8:])
         print(_col("Recent:", MAGENTA), _col(recent, BOLD))
 
     # Filters
@@ -104,11 +206,16 @@ def show_menu(output_filename: str = None, show_commands: bool = True):
 
 
 def _load_image(path: str):
+    global loaded_path
     try:
-        img = Image.open(path)
+        with _measure("load", path) as record:
+            img = formats.open_image(path)
+            if record is not None:
+                record["pixels"] = _pixels(img)
         F.img = img
-        F.width, F.height = img.size
-        print(_col("Loaded image:", GREEN), _col(f"{path}", BOLD), _col(f"({F.width}x{F.height})", CYAN))
+        loaded_path = path
+        w, h = img.size
+        print(_col("Loaded image:", GREEN), _col(f"{path}", BOLD), _col(f"({w}x{h})", CYAN))
         return True
     except Exception as e:
         print(_col("Failed to open:", RED), _col(path, BOLD), "->", _col(str(e), RED))
@@ -130,87 +237,286 @@ def show_welcome():
     print("\n" + _col("Quick example:", GREEN) + "\n  python main.py -i input.jpg -f \"1,sepia\" -o result.jpg\n")
 
 
-def apply_sequence(tokens, output_filename="output.jpg", input_filename: str = None):
-    """Apply a sequence of filter tokens (numbers or names) to the current image.
-    If input_filename is provided, load that image first.
+def lookup_filter(token):
+    """Resolve a filter number or name to its (name, func) pair; raises ValueError."""
+    try:
+        n = int(token)
+    except Exception:
+        n = None
+
+    if n is not None:
+        if not (1 <= n <= len(FILTERS)):
+            raise ValueError(f"Filter number out of range: {n}")
+        return FILTERS[n - 1]
+    matches = [pair for pair in FILTERS if pair[0].lower() == str(token).lower()]
+    if not matches:
+        raise ValueError(f"No filter named '{token}'")
+    return matches[0]
+
+
+def _find_filter(token: str):
+    """Resolve a filter number or name to its (name, func) pair, or None."""
+    try:
+        return lookup_filter(token)
+    except ValueError as e:
+        print(_col(str(e), RED))
+        return None
+
+
+def resolve_stage(item):
+    """Resolve a filter name/number, or a {"name": ..., params} object, without prompting.
+
+    Returns (name, func, params); raises ValueError.
     """
-    if input_filename:
-        if not _load_image(input_filename):
-            return
+    if isinstance(item, dict):
+        params = dict(item)
+        token = params.pop("name", None)
+        if token is None:
+            raise ValueError("Filter objects need a 'name'")
+    else:
+        token, params = item, {}
+    name, func = lookup_filter(str(token).strip())
+    return name, func, F.check_params(func, params)
 
-    if not hasattr(F, 'img') or F.img is None:
-        print(_col("No image loaded.", YELLOW), "Use", _col("-i/--input", BOLD), "to provide an image first.")
-        return
 
-    applied = False
+def plan_chain(tokens):
+    """Resolve filter tokens into a list of execution steps.
+
+    Each step is a list of (name, func, params). Consecutive per-pixel filters
+    share one step and run as a single fused pass; neighbourhood filters such
+    as pixelate or smoothing always get a step of their own. Parameters are
+    prompted for here, before any pixels are touched, except for tokens given
+    as {"name": ..., params} objects (as in recipe files).
+    """
+    return group_stages(plan_stages(resolve_tokens(tokens)))
+
+
+def resolve_tokens(tokens):
+    """Resolve filter tokens into (name, func, params) stages, prompting for parameters."""
+    stages = []
     for token in tokens:
+        if isinstance(token, dict):
+            try:
+                stages.append(resolve_stage(token))
+            except ValueError as e:
+                print(_col(str(e), RED))
+            continue
         token = token.strip()
         if not token:
             continue
-        # numeric token?
-        try:
-            n = int(token)
-        except Exception:
-            n = None
+        found = _find_filter(token)
+        if found is None:
+            continue
+        name, func = found
+        params = F.ask_params(func)
+        if params is None:
+            continue
+        stages.append((name, func, params))
+    return stages
 
-        if n is not None:
-            if not (1 <= n <= len(FILTERS)):
-                print(_col("Filter number out of range:", RED), _col(str(n), BOLD))
-                continue
-            name, func = FILTERS[n - 1]
+
+def plan_stages(stages):
+    """Run the planner over resolved stages when reordering is enabled, printing its changes."""
+    if not reorder:
+        return list(stages)
+    stages, notes = optimize_stages(stages)
+    for note in notes:
+        print(_col("Planner:", CYAN), note)
+    return stages
+
+
+def optimize_stages(stages):
+    """Reorder and prune stages where that leaves every output pixel unchanged.
+
+    Grayscale keeps only the red channel, so it moves ahead of filters that
+    compute each channel on its own (they then process one channel instead
+    of three). A Grayscale or Pixelate repeated right after itself with the
+    same parameters has no effect and is dropped. Returns (stages, notes).
+    """
+    stages = list(stages)
+    notes = []
+    for i, (name, func, _) in enumerate(stages):
+        if func.__name__ != "grayscale":
+            continue
+        j = i
+        while j > 0 and F.is_channelwise(stages[j - 1][1]):
+            j -= 1
+        if j < i:
+            passed = ", ".join(stage[0] for stage in stages[j:i])
+            stages.insert(j, stages.pop(i))
+            notes.append(f"moved {name} before {passed}")
+    kept = []
+    for name, func, params in stages:
+        if kept and func.__name__ in ("grayscale", "pixelate") and kept[-1][1].__name__ == func.__name__ \
+                and kept[-1][2] == params:
+            notes.append(f"dropped repeated {name}")
+            continue
+        kept.append((name, func, params))
+    return kept, notes
+
+
+def group_stages(stages):
+    """Group (name, func, params) stages into steps, fusing consecutive per-pixel filters."""
+    steps = []
+    for stage in stages:
+        if F.is_point_filter(stage[1]) and steps and F.is_point_filter(steps[-1][-1][1]):
+            steps[-1].append(stage)
         else:
-            matches = [pair for pair in FILTERS if pair[0].lower() == token.lower()]
-            if not matches:
-                print(_col("No filter named", RED), _col(f"'{token}'", BOLD))
-                continue
-            name, func = matches[0]
+            steps.append([stage])
+    return steps
+
+
+def apply_steps(img, steps):
+    """Apply planned steps to img without printing; errors propagate to the caller."""
+    for step in steps:
+        if len(step) == 1:
+            _, func, params = step[0]
+            func(img, **params)
+        else:
+            F.apply_points(img, [(func, params) for _, func, params in step])
 
-        print(_col("Applying:", YELLOW), _col(name, BOLD), _col("...", YELLOW))
+
+def run_plan(steps):
+    """Apply planned steps to the current image. Returns the steps that succeeded.
+
+    When the result cache is enabled, the longest cached prefix of the chain
+    is reused and the result of every step is stored.
+    """
+    if getattr(F, 'img', None) is None:
+        print(_col("No image loaded.", YELLOW), "Use", _col("-i <path>", BOLD), "to load an image first.")
+        return []
+    if result_cache is not None:
+        return result_cache.run(steps)
+    return _run_steps(steps)
+
+
+def _run_steps(steps):
+    applied = []
+    for step in steps:
+        names = [name for name, _, _ in step]
+        label = " + ".join(names)
+        print(_col("Applying:", YELLOW), _col(label, BOLD), _col("...", YELLOW))
         try:
-            func(F.img)
-            applied = True
+            with _measure("stage", label, _pixels(F.img)) as record:
+                apply_steps(F.img, [step])
+            applied.append(step)
             # record in session history
-            session_history.append(name)
+            record_history(names, record)
         except Exception as e:
-            print(_col("Error applying filter", RED), _col(name, BOLD), _col("->", RED), _col(str(e), RED))
+            print(_col("Error applying filter", RED), _col(label, BOLD), _col("->", RED), _col(str(e), RED))
+    return applied
+
+
+def apply_sequence(tokens, output_filename="output.jpg", input_filename: str = None):
+    """Apply a sequence of filter tokens (numbers or names) to the current image.
+    If input_filename is provided, load that image first.
+    """
+    if input_filename:
+        if not _load_image(input_filename):
+            return
+
+    if not hasattr(F, 'img') or F.img is None:
+        print(_col("No image loaded.", YELLOW), "Use", _col("-i/--input", BOLD), "to provide an image first.")
+        return
+
+    applied = run_plan(plan_chain(tokens))
 
     if applied:
+        _save_image(output_filename, "Saved final image as")
+    _finish_profile()
+
+
+def _step_names(steps) -> str:
+    return ", ".join(name for step in steps for name, _, _ in step)
+
+
+def _preview_filename(output_filename: str) -> str:
+    stem, ext = os.path.splitext(output_filename)
+    return f"{stem}.preview{ext or '.jpg'}"
+
+
+def _start_preview(history, max_side: int):
+    """Create a proxy of the current image; decodes from disk if it is unmodified."""
+    source = loaded_path if loaded_path and not history.can_undo() else F.img
+    try:
+        preview = P.ProxyPreview(source, apply_steps, max_side)
+    except Exception as e:
+        print(_col("Failed to create preview:", RED), _col(str(e), RED))
+        return None
+    w, h = preview.base.size
+    print(_col("Preview mode:", MAGENTA), _col(f"proxy {w}x{h}", BOLD),
+          "- filters run on the proxy;", _col("commit", BOLD), "applies them at full resolution")
+    return preview
+
+
+def _run_preview(preview, steps):
+    """Apply planned steps to the preview proxy. Returns the steps that succeeded."""
+    applied = []
+    for step, scaled in zip(steps, preview.scale_steps(steps)):
+        label = " + ".join(name for name, _, _ in step)
+        print(_col("Preview:", YELLOW), _col(label, BOLD), _col("...", YELLOW))
         try:
-            F.img.save(output_filename)
-            print(_col("Saved final image as", GREEN), _col(output_filename, BOLD))
+            apply_steps(preview.image, [scaled])
+            applied.append(step)
         except Exception as e:
-            print(_col("Failed to save result:", RED), _col(str(e), RED))
+            print(_col("Error applying filter", RED), _col(label, BOLD), _col("->", RED), _col(str(e), RED))
+    if applied:
+        preview.record(applied)
+    return applied
+
+
+def _save_preview(preview, output_filename: str):
+    try:
+        fn, seconds, size = formats.save(preview.image, _preview_filename(output_filename))
+        print(f"Saved preview as {fn} ({formats.describe(seconds, size)})")
+    except Exception as e:
+        print(_col("Failed to save preview:", RED), _col(str(e), RED))
 
 
 def main(output_filename: str = "output.jpg", input_filename: str = None):
     """Interactive menu. Enter numbers or names (comma-separated). Commands:
-    --list, --help, -o <filename>, -i <path>, exit
+    --list, --help, -o <filename>, -i <path>, undo, redo, --preview, commit, exit
     """
     # Show welcome banner
     show_welcome()
 
+    # Undo/redo history of the session, one state per applied chain
+    history = snapshots.SnapshotStore(apply_steps, undo_budget_mb)
+
     # Load input image if provided
     if input_filename:
         if not _load_image(input_filename):
             return
+        history.reset(F.img)
+    elif getattr(F, 'img', None) is not None:
+        history.reset(F.img)
 
-    if not hasattr(F, 'img') or F.img is None:
-        # No image loaded yet; allow user to set image from prompt
-        pass
+    try:
+        _prompt_loop(output_filename, history)
+    finally:
+        history.close()
+
+
+def _prompt_loop(output_filename: str, history):
+
+    # Proxy preview state; None while working at full resolution
+    preview = None
+    if preview_max_side and getattr(F, 'img', None) is not None:
+        preview = _start_preview(history, preview_max_side)
 
     # Show a compact hint instead of the full menu on startup
     print(_col("Tip:", YELLOW), "Type", _col("--list", BOLD), "to view available filters,", _col("-i <path>", BOLD), "to load an image, or", _col("0", BOLD), "to exit.")
 
     while True:
         raw = input("Enter command or filter(s) (or --help for commands): ")
-        if not raw:
+        stripped = raw.strip()
+        if not stripped:
             print("No input provided. Try again.")
             continue
 
-        stripped = raw.strip()
         # support simple command-style inputs entered at the prompt
-        if stripped.startswith('-') or stripped.startswith('exit') or stripped.startswith('quit'):
-            parts = stripped.split()
+        parts = stripped.split()
+        if stripped.startswith('-') or parts[0] in ('exit', 'quit', 'undo', 'redo', 'commit'):
             cmd = parts[0]
             if cmd in ('--list', '-l'):
                 # show a compact listing (no Commands block) when user requests --list
@@ -222,6 +528,10 @@ def main(output_filename: str = "output.jpg", input_filename: str = None):
                 print("  --help, -h          Show this menu")
                 print("  -o <filename>       Set output filename for saved result")
                 print("  -i <filename>       Load a different input image")
+                print("  undo, redo          Step back or forward through applied filters")
+                print("  --snapshots         Show undo history memory usage")
+                print("  --preview [N|off]   Try filters on a proxy of at most N pixels per side")
+                print("  commit              Apply previewed filters at full resolution and save")
                 print("  exit, quit, 0       Exit the menu")
                 continue
             if cmd in ('-o', '--output'):
@@ -234,10 +544,72 @@ def main(output_filename: str = "output.jpg", input_filename: str = None):
             if cmd in ('-i', '--input'):
                 if len(parts) >= 2:
                     fn = parts[1]
-                    _load_image(fn)
+                    if _load_image(fn):
+                        history.reset(F.img)
+                        if preview is not None:
+                            preview = _start_preview(history, preview.max_side)
                 else:
                     print("Usage: -i <filename>")
                 continue
+            if cmd in ('undo', '--undo', 'redo', '--redo') and preview is not None:
+                undo = cmd.endswith('undo')
+                if preview.can_undo() if undo else preview.can_redo():
+                    steps = preview.undo() if undo else preview.redo()
+                    print(_col("Undid:" if undo else "Redid:", MAGENTA), _col(_step_names(steps), BOLD), "(preview)")
+                    _save_preview(preview, output_filename)
+                    continue
+                # Nothing pending in the preview: step through the committed history below
+            if cmd in ('undo', '--undo', 'redo', '--redo'):
+                undo = cmd.endswith('undo')
+                if not (history.can_undo() if undo else history.can_redo()):
+                    print(f"Nothing to {cmd.lstrip('-')}.")
+                    continue
+                F.img, steps = history.undo() if undo else history.redo()
+                print(_col("Undid:" if undo else "Redid:", MAGENTA), _col(_step_names(steps), BOLD))
+                _save_image(output_filename)
+                if preview is not None:
+                    preview = _start_preview(history, preview.max_side)
+                continue
+            if cmd == '--snapshots':
+                usage = history.usage()
+                print(_col("Undo history:", MAGENTA),
+                      f"{usage['raw']} raw, {usage['compressed']} compressed, {usage['spilled']} spilled, {usage['dropped']} dropped;",
+                      f"{usage['memory_mb']:.1f} MB in memory, {usage['disk_mb']:.1f} MB on disk")
+                continue
+            if cmd == '--preview':
+                arg = parts[1] if len(parts) >= 2 else None
+                if arg == 'off':
+                    if preview is not None and preview.pending():
+                        print(_col("Discarded uncommitted preview filters:", YELLOW), _col(_step_names(preview.pending()), BOLD))
+                    preview = None
+                    print("Preview mode off.")
+                    continue
+                try:
+                    max_side = int(arg) if arg else (preview.max_side if preview else P.DEFAULT_MAX_SIDE)
+                except ValueError:
+                    print("Usage: --preview [max_side|off]")
+                    continue
+                if getattr(F, 'img', None) is None:
+                    print(_col("No image loaded.", YELLOW), "Use", _col("-i <path>", BOLD), "first.")
+                    continue
+                preview = _start_preview(history, max_side)
+                continue
+            if cmd in ('commit', '--commit'):
+                if preview is None or not preview.pending():
+                    print("Nothing to commit.")
+                    continue
+                print(_col("Committing:", YELLOW), _col(_step_names(preview.pending()), BOLD), _col("at full resolution ...", YELLOW))
+                try:
+                    with _measure("stage", "commit", _pixels(F.img)):
+                        F.img, steps = preview.commit(F.img)
+                except Exception as e:
+                    print(_col("Commit failed:", RED), _col(str(e), RED))
+                    continue
+                record_history([name for step in steps for name, _, _ in step])
+                history.push(F.img, steps)
+                _save_image(output_filename)
+                _finish_profile()
+                continue
             if cmd in ('menu', '--menu'):
                 show_menu(output_filename)
                 continue
@@ -250,40 +622,19 @@ def main(output_filename: str = "output.jpg", input_filename: str = None):
             print("Exiting.")
             break
 
-        # Apply chosen filters
-        applied_any = False
-        for token in entries:
-            try:
-                n = int(token)
-            except Exception:
-                n = None
-
-            if n is not None:
-                if not (1 <= n <= len(FILTERS)):
-                    print(f"Filter number out of range: {n}")
-                    continue
-                name, func = FILTERS[n - 1]
-            else:
-                matches = [pair for pair in FILTERS if pair[0].lower() == token.lower()]
-                if not matches:
-                    print(f"No filter named '{token}' found")
-                    continue
-                name, func = matches[0]
+        # In preview mode filters only touch the proxy until commit
+        if preview is not None:
+            if _run_preview(preview, plan_chain(entries)):
+                _save_preview(preview, output_filename)
+            continue
 
-            print(_col("Applying:", YELLOW), _col(name, BOLD), _col("...", YELLOW))
-            try:
-                func(F.img)
-                applied_any = True
-                session_history.append(name)
-            except Exception as e:
-                print(_col("Error applying filter", RED), _col(name, BOLD), _col("->", RED), _col(str(e), RED))
+        # Apply chosen filters
+        applied_any = run_plan(plan_chain(entries))
 
         if applied_any:
-            try:
-                F.img.save(output_filename)
-                print(f"Saved result as {output_filename}")
-            except Exception as e:
-                print(f"Failed to save result: {e}")
+            history.push(F.img, applied_any)
+            _save_image(output_filename)
+        _finish_profile()
 
 
 def cli(argv=None):
@@ -296,9 +647,19 @@ def cli(argv=None):
     parser.add_argument("-f", "--filters", help="comma-separated list of filters (numbers or names)")
     parser.add_argument("-i", "--input", help="input image filename to load before applying filters")
     parser.add_argument("-o", "--output", default="output.jpg", help="output filename (default: output.jpg)")
+    parser.add_argument("--backend", choices=F.BACKENDS, help="filter backend (default: numpy when installed)")
+    parser.add_argument("--border", choices=F.BORDER_MODES, help="border handling for smoothing/sharpen/gradient (default: edge)")
 
     args = parser.parse_args(argv)
 
+    if args.backend:
+        try:
+            F.set_backend(args.backend)
+        except ValueError as e:
+            parser.error(str(e))
+    if args.border:
+        F.set_border(args.border)
+
     # If the user asked for help (-h/--help) we treat that as a request to open the interactive menu
     if args.help:
         main(output_filename=args.output, input_filename=args.input)
@@ -3,12 +3,20 @@
 This file is a lightweight entrypoint. It supports two modes:
 - Launch the interactive CLI menu: python main.py --cli
 - Apply a specific filter by number or name: python main.py <number|name>
+- Apply a chain to a folder of images: python main.py --batch <dir|glob> -f <filters> --outdir <dir>
+- Run a local job server: python main.py --serve (send jobs with --submit http://127.0.0.1:8765)
+- Run a JSON recipe, or only print its plan: python main.py --recipe job.json [--dry-run]
+- Write several outputs from one decode: python main.py -i in.jpg --fanout a.png=<filters> --fanout b.png=<filters>
 
 If no arguments are provided the script prints usage instructions.
 """
 
 import argparse
+import os
+import functions as F
 import interface
+import cache
+import formats
 
 
 def main(argv=None):
@@ -17,19 +25,197 @@ def main(argv=None):
     parser.add_argument("--list", action="store_true", help="list available filters")
     parser.add_argument("-f", "--filters", help="comma-separated list of filters (numbers or names)")
     parser.add_argument("-i", "--input", help="input image filename to load before applying filters")
-    parser.add_argument("-o", "--output", default="output.jpg", help="output filename (default: output.jpg)")
+    parser.add_argument("-o", "--output", help="output filename (default: output.jpg)")
+    parser.add_argument("--recipe", metavar="FILE", help="JSON recipe with the filter stages and their parameters (see recipes.py)")
+    parser.add_argument("--fanout", action="append", metavar="OUTPUT=FILTERS",
+                        help="write OUTPUT with its own comma-separated filters; repeat for more outputs from one decode (-f stages run first for all)")
+    parser.add_argument("--dry-run", action="store_true", help="print the planned steps and estimated time without filtering")
+    parser.add_argument("--no-reorder", action="store_true", help="run filters in the order given instead of the planner's")
+    parser.add_argument("--batch", metavar="SOURCE", help="apply --filters to every image in a directory or glob pattern")
+    parser.add_argument("--outdir", default="output", help="output directory for --batch (default: output)")
+    parser.add_argument("-j", "--jobs", type=int, help="worker processes for --batch (default: CPU count), or for filtering the frames of an animated -i (default: none)")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="run --batch in one process with overlapped decode, filter and encode stages")
+    parser.add_argument("--depth", type=int, default=2, help="images queued between --pipeline stages (default: %(default)s)")
+    parser.add_argument("--threads", type=int, metavar="N",
+                        help="threads per image for the numpy backend (default: CPU count; 1 per worker with --batch)")
+    parser.add_argument("--serve", action="store_true", help="run a local job server with a warm worker pool (-j workers)")
+    parser.add_argument("--host", default="127.0.0.1", help="loopback address for --serve (default: %(default)s)")
+    parser.add_argument("--port", type=int, default=8765, help="port for --serve (default: %(default)s)")
+    parser.add_argument("--root", metavar="DIR", help="directory --serve jobs may read and write in (default: current directory)")
+    parser.add_argument("--queue", type=int, default=64, help="jobs --serve queues beyond its workers before refusing (default: %(default)s)")
+    parser.add_argument("--submit", metavar="URL", help="run -i/-f/-o as a job on a server started with --serve")
+    parser.add_argument("--tile-rows", type=int, metavar="N", help="process the image in strips of N rows to bound memory use")
+    parser.add_argument("--cache", action="store_true", help="reuse and store filter results in the on-disk cache")
+    parser.add_argument("--cache-dir", default=cache.DEFAULT_DIR, help="cache directory (default: %(default)s)")
+    parser.add_argument("--cache-max-mb", type=float, default=cache.DEFAULT_MAX_MB, help="cache size limit in MB (default: %(default)s)")
+    parser.add_argument("--cache-info", action="store_true", help="show cache location and usage, then exit")
+    parser.add_argument("--cache-purge", action="store_true", help="delete every cache entry, then exit")
+    parser.add_argument("--profile", action="store_true", help="print per-stage timings, throughput and memory")
+    parser.add_argument("--trace", metavar="FILE", help="with --profile, write a Chrome trace-event JSON file")
+    parser.add_argument("--undo-mb", type=float, default=interface.undo_budget_mb, help="memory budget in MB for interactive undo/redo (default: %(default)s)")
+    parser.add_argument("--preview", type=int, nargs="?", const=1024, metavar="MAX_SIDE",
+                        help="start the interactive menu in proxy preview mode (default proxy size: 1024)")
+    parser.add_argument("--format", choices=formats.FORMATS,
+                        help="output format, replacing the output extension (ppm/npy are uncompressed and load memory-mapped)")
+    parser.add_argument("--quality", type=int, help="JPEG/WebP quality, 1-100 (default: Pillow's 75)")
+    parser.add_argument("--optimize", action="store_true", help="optimize JPEG/PNG encoding (smaller files, slower saves)")
+    parser.add_argument("--progressive", action="store_true", help="write progressive JPEGs")
+    parser.add_argument("--compress-level", type=int, metavar="0-9", help="PNG zlib level; 0-1 save fastest (default: Pillow's 6)")
+    parser.add_argument("--backend", choices=F.BACKENDS, help="filter backend (default: numpy when installed)")
+    parser.add_argument("--border", choices=F.BORDER_MODES, help="border handling for smoothing/sharpen/gradient (default: edge)")
 
     args = parser.parse_args(argv)
 
+    if args.backend:
+        try:
+            F.set_backend(args.backend)
+        except ValueError as e:
+            parser.error(str(e))
+    if args.border:
+        F.set_border(args.border)
+    if args.threads is not None and args.threads < 1:
+        parser.error("--threads must be at least 1")
+    try:
+        formats.set_save_options(args.format, args.quality, args.optimize, args.progressive, args.compress_level)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.recipe:
+        import recipes
+        try:
+            recipe = recipes.load_recipe(args.recipe)
+        except (OSError, ValueError) as e:
+            parser.error(f"--recipe: {e}")
+        if args.filters:
+            parser.error("--recipe and -f/--filters cannot be combined")
+        args.input = args.input or recipe["input"]
+        args.output = args.output or recipe["output"]
+        interface.reorder = recipe["reorder"]
+    args.output = args.output or "output.jpg"
+    if args.recipe:
+        tokens = recipe["stages"]
+    else:
+        tokens = [t.strip() for t in (args.filters or "").split(",") if t.strip()]
+    if args.no_reorder:
+        interface.reorder = False
+    chains = list(recipe["outputs"]) if args.recipe else []
+    for spec in args.fanout or []:
+        output, sep, filters = spec.partition("=")
+        if not sep or not output.strip():
+            parser.error(f"--fanout expects OUTPUT=FILTERS, got {spec!r}")
+        chains.append((output.strip(), [t.strip() for t in filters.split(",") if t.strip()]))
+
+    if args.cache_info or args.cache_purge:
+        result_cache = cache.ResultCache(args.cache_dir, args.cache_max_mb)
+        if args.cache_purge:
+            print(f"Removed {result_cache.purge()} cache entries")
+        if args.cache_info:
+            result_cache.show_info()
+        return
+
+    if args.cache:
+        interface.result_cache = cache.ResultCache(args.cache_dir, args.cache_max_mb)
+
+    interface.undo_budget_mb = args.undo_mb
+    interface.preview_max_side = args.preview
+
+    if args.profile:
+        import profiling
+        interface.profiler = profiling.Profiler()
+        interface.trace_filename = args.trace
+    elif args.trace:
+        parser.error("--trace requires --profile")
+
     if args.list:
         interface.list_filters()
         return
 
-    if args.filters:
-        tokens = [t.strip() for t in args.filters.split(",") if t.strip()]
+    if chains:
+        if args.batch or args.serve or args.submit or args.tile_rows:
+            parser.error("--fanout (or recipe outputs) cannot be combined with --batch, --serve, --submit or --tile-rows")
+        if not args.input:
+            parser.error("--fanout requires -i/--input (or the recipe's input)")
+        import fanout
+        import frames
+        try:
+            fanout.check_outputs(chains)
+        except ValueError as e:
+            parser.error(f"--fanout: {e}")
+        if frames.is_animated(args.input):
+            parser.error("--fanout works on single-frame images")
+        if args.dry_run:
+            root, unshared = fanout.plan_fanout(chains, tokens)
+            try:
+                fanout.print_plan(args.input, root, unshared)
+            except (OSError, ValueError) as e:
+                parser.error(str(e))
+            return
+        F.set_threads(args.threads or os.cpu_count() or 1)
+        fanout.run_fanout(args.input, chains, tokens)
+        return
+
+    if args.dry_run:
+        if not tokens:
+            parser.error("--dry-run requires -f/--filters or --recipe")
+        import batch
+        import recipes
+        paths = batch.find_inputs(args.batch) if args.batch else [args.input] if args.input else []
+        if not paths:
+            parser.error("--dry-run requires an input image (-i/--input, --batch or the recipe's input)")
+        steps = interface.plan_chain(tokens)
+        if steps:
+            try:
+                recipes.print_plan(paths, steps)
+            except (OSError, ValueError) as e:
+                parser.error(str(e))
+        return
+
+    if args.serve:
+        import server  # only needed when serving
+        try:
+            server.serve(args.host, args.port, workers=args.jobs, queue_size=args.queue,
+                         threads=args.threads or 1, root=args.root)
+        except ValueError as e:
+            parser.error(str(e))
+        return
+
+    if args.submit:
+        if not (args.input and tokens):
+            parser.error("--submit requires -i/--input and -f/--filters (or --recipe)")
+        import server
+        server.submit_chain(args.submit, args.input, args.output, tokens)
+        return
+
+    if args.batch:
         if not tokens:
-            print("No filters provided to --filters")
+            parser.error("--batch requires -f/--filters or --recipe")
+        if args.pipeline:
+            import pipeline  # only needed for pipelined runs
+            F.set_threads(args.threads or os.cpu_count() or 1)
+            pipeline.run_pipeline(args.batch, args.outdir, tokens, depth=args.depth)
+            return
+        import batch  # only needed for batch runs
+        batch.run_batch(args.batch, args.outdir, tokens, workers=args.jobs, threads=args.threads or 1)
+        return
+
+    F.set_threads(args.threads or os.cpu_count() or 1)
+
+    if args.filters and not tokens:
+        print("No filters provided to --filters")
+        return
+    if tokens:
+        if args.tile_rows:
+            if not args.input:
+                parser.error("--tile-rows requires -i/--input")
+            import tiles  # needs NumPy; only imported for tiled runs
+            tiles.run_tiled(args.input, args.output, tokens, tile_rows=args.tile_rows)
             return
+        if args.input:
+            import frames
+            if frames.is_animated(args.input):
+                frames.run_frames(args.input, args.output, tokens, workers=args.jobs)
+                return
         interface.apply_sequence(tokens, args.output, input_filename=args.input)
         return
 
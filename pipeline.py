@@ -0,0 +1,117 @@
+"""
+pipeline.py - Overlapped decode, filter and encode for multi-image runs.
+
+Each image goes through three stages connected by bounded queues: a reader
+thread opens and decodes ahead of the filters, the calling thread applies
+the chain, and a writer thread encodes and saves. Pillow's codecs and the
+NumPy engine release the GIL, so disk I/O, decoding, filtering and encoding
+of different images overlap. At most `2 * depth + 3` images are held in
+memory at once, whatever the number of inputs.
+
+Animated and multi-page inputs stream their own frames (see frames.py), so
+they are processed one after another once the pipeline has drained.
+"""
+
+import queue
+import threading
+import time
+
+import batch
+import formats
+import frames
+import interface
+from interface import _col, BOLD, CYAN, RED, YELLOW
+
+DEFAULT_DEPTH = 2
+
+# Marks the end of a stage's output
+_DONE = None
+
+
+def _reader(paths, out_queue, busy):
+    for path in paths:
+        start = time.perf_counter()
+        try:
+            item = (path, formats.open_image(path), None)
+        except Exception as e:
+            item = (path, None, str(e))
+        busy["decode"] += time.perf_counter() - start
+        out_queue.put(item)
+    out_queue.put(_DONE)
+
+
+def _writer(in_queue, outputs, results, busy):
+    while True:
+        item = in_queue.get()
+        if item is _DONE:
+            return
+        path, img, error = item
+        pixels = 0
+        saved = None
+        if error is None:
+            start = time.perf_counter()
+            try:
+                saved = formats.save(img, outputs[path])
+                pixels = img.size[0] * img.size[1]
+                batch.report_saved(*saved)
+            except Exception as e:
+                error = str(e)
+            busy["encode"] += time.perf_counter() - start
+        if error is not None:
+            print(_col("Failed:", RED), _col(path, BOLD), "->", _col(error, RED))
+        results.append((path, error, pixels, saved))
+
+
+def run_pipeline(source: str, output_dir: str, tokens, depth: int = DEFAULT_DEPTH):
+    """Apply the filter tokens to every image in source with overlapped stages.
+
+    `depth` bounds how many images wait between stages. Returns the list of
+    (path, error) pairs for the files that failed.
+    """
+    outputs, steps = batch.prepare(source, output_dir, tokens)
+    if not steps:
+        return []
+    animated = [path for path in outputs if frames.is_animated(path)]
+    singles = [path for path in outputs if path not in animated]
+    depth = max(1, depth)
+    decoded = queue.Queue(depth)
+    filtered = queue.Queue(depth)
+    busy = {"decode": 0.0, "filter": 0.0, "encode": 0.0}
+    results = []
+
+    print(_col("Processing", YELLOW), _col(str(len(outputs)), BOLD), _col("images in a pipeline of depth", YELLOW), _col(str(depth), BOLD), _col("...", YELLOW))
+    start = time.perf_counter()
+    reader = threading.Thread(target=_reader, args=(singles, decoded, busy), name="decode", daemon=True)
+    writer = threading.Thread(target=_writer, args=(filtered, outputs, results, busy), name="encode", daemon=True)
+    reader.start()
+    writer.start()
+    while True:
+        item = decoded.get()
+        if item is _DONE:
+            break
+        path, img, error = item
+        if error is None:
+            t = time.perf_counter()
+            try:
+                interface.apply_steps(img, steps)
+            except Exception as e:
+                img, error = None, str(e)
+            busy["filter"] += time.perf_counter() - t
+        filtered.put((path, img, error))
+    filtered.put(_DONE)
+    writer.join()
+    for path in animated:
+        path, error, pixels, _, saved = batch._process((path, outputs[path], steps))
+        if error is None:
+            batch.report_saved(*saved)
+        else:
+            print(_col("Failed:", RED), _col(path, BOLD), "->", _col(error, RED))
+        results.append((path, error, pixels, saved))
+    elapsed = time.perf_counter() - start
+
+    failures = [(path, error) for path, error, _, _ in results if error is not None]
+    saved = [written for _, _, _, written in results if written is not None]
+    batch.report(len(outputs), failures, sum(pixels for _, _, pixels, _ in results), elapsed, output_dir, saved)
+    stages = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in busy.items())
+    print(_col("Stages:", CYAN), f"{stages} busy in {elapsed:.2f}s wall time")
+    return failures
@@ -0,0 +1,109 @@
+"""
+preview.py - Low-resolution proxy previews for the interactive menu.
+
+A `ProxyPreview` holds a reduced copy of the image (decoded with Pillow's
+JPEG draft mode when possible, so the full image is never decoded) and the
+chains tried on it. Pixel-sized parameters such as the pixelate block size
+are scaled to the proxy so it looks like the full result would. Nothing
+touches the full-resolution image until `commit` replays the pending
+chains on it.
+"""
+
+import os
+
+import formats
+import functions as F
+
+DEFAULT_MAX_SIDE = 1024
+
+
+def load_proxy(source, max_side: int = DEFAULT_MAX_SIDE):
+    """Return (proxy, full_size) for a path or an already loaded image."""
+    from PIL import Image
+
+    if isinstance(source, str) and os.path.splitext(source)[1].lower() in formats.RAW_EXTENSIONS:
+        # Read straight from a memory map; there is nothing to decode
+        source = formats.open_image(source)
+    if isinstance(source, str):
+        img = Image.open(source)
+        full_size = img.size
+        if max(full_size) > max_side:
+            ratio = max_side / max(full_size)
+            # Lets the JPEG decoder scale by 1/2, 1/4 or 1/8 while decoding
+            img.draft("RGB", (max(1, int(full_size[0] * ratio)), max(1, int(full_size[1] * ratio))))
+    else:
+        full_size = source.size
+        img = source.copy()
+    img.thumbnail((max_side, max_side))
+    img.load()
+    return F.normalize_mode(img), full_size
+
+
+class ProxyPreview:
+    """Filters applied to a proxy image, pending a commit to the full image.
+
+    replay(img, steps) must apply planned steps to img in place.
+    """
+
+    def __init__(self, source, replay, max_side: int = DEFAULT_MAX_SIDE):
+        self.replay = replay
+        self.max_side = max_side
+        self.reset(source)
+
+    def reset(self, source):
+        """Start over from source (a path or a full-resolution image)."""
+        self.base, self.full_size = load_proxy(source, self.max_side)
+        self.image = self.base.copy()
+        self.chains = []
+        self.undone = []
+
+    @property
+    def scale(self) -> float:
+        return self.base.size[0] / self.full_size[0]
+
+    def scale_steps(self, steps):
+        """Return steps with pixel-sized parameters scaled to the proxy."""
+        return [[(name, func, F.scale_params(func, params, self.scale)) for name, func, params in step]
+                for step in steps]
+
+    def record(self, steps):
+        """Remember a chain (with full-resolution parameters) applied to the proxy."""
+        self.chains.append(steps)
+        self.undone = []
+
+    def pending(self):
+        """Return every pending step in order."""
+        return [step for chain in self.chains for step in chain]
+
+    def can_undo(self) -> bool:
+        return bool(self.chains)
+
+    def can_redo(self) -> bool:
+        return bool(self.undone)
+
+    def undo(self):
+        """Drop the last chain and rebuild the proxy. Returns the chain."""
+        chain = self.chains.pop()
+        self.undone.append(chain)
+        self.image = self.base.copy()
+        for steps in self.chains:
+            self.replay(self.image, self.scale_steps(steps))
+        return chain
+
+    def redo(self):
+        """Re-apply the last undone chain. Returns the chain."""
+        chain = self.undone.pop()
+        self.chains.append(chain)
+        self.replay(self.image, self.scale_steps(chain))
+        return chain
+
+    def commit(self, full_img):
+        """Replay the pending chains on a copy of full_img and start a new preview from it.
+
+        Returns (result, steps). full_img is left untouched if a step fails.
+        """
+        steps = self.pending()
+        result = full_img.copy()
+        self.replay(result, steps)
+        self.reset(result)
+        return result, steps
@@ -0,0 +1,90 @@
+"""
+profiling.py - Opt-in timing instrumentation for filter chains.
+
+A `Profiler` records wall time, pixels processed, throughput and resident
+memory delta for image loading, every filter step and saving. It prints a
+summary table and can write a trace in the Chrome trace-event JSON format,
+which chrome://tracing and Perfetto can open directly.
+"""
+
+import json
+import os
+import time
+from contextlib import contextmanager
+
+from interface import _col, BOLD, CYAN
+
+
+def _rss_bytes():
+    """Return the current resident set size in bytes, or None if unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError, IndexError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except Exception:
+        return None
+
+
+class Profiler:
+    """Collects one record per measured load, filter step or save."""
+
+    def __init__(self):
+        self.records = []
+        self._origin = time.perf_counter()
+        self._reported = 0
+
+    @contextmanager
+    def measure(self, kind: str, name: str, pixels: int = 0):
+        """Time the enclosed block. Yields the record, which is kept only on success."""
+        record = {"kind": kind, "name": name, "pixels": pixels}
+        rss_before = _rss_bytes()
+        start = time.perf_counter()
+        yield record
+        seconds = time.perf_counter() - start
+        rss_after = _rss_bytes()
+        record["start"] = start - self._origin
+        record["seconds"] = seconds
+        pixels = record["pixels"]
+        record["mp_per_s"] = pixels / 1e6 / seconds if pixels and seconds > 0 else None
+        if rss_before is not None and rss_after is not None:
+            record["mem_delta_mb"] = (rss_after - rss_before) / 1e6
+        else:
+            record["mem_delta_mb"] = None
+        self.records.append(record)
+
+    def report(self):
+        """Print a table of the records added since the previous report."""
+        records = self.records[self._reported:]
+        self._reported = len(self.records)
+        if not records:
+            return
+        print(_col("\nProfile:", BOLD + CYAN))
+        print(_col(f"  {'Kind':<6} {'Name':<40} {'Time (s)':>9} {'MP':>7} {'MP/s':>9} {'Mem MB':>8}", BOLD))
+        for r in records:
+            mp = f"{r['pixels'] / 1e6:.2f}" if r["pixels"] else "-"
+            rate = f"{r['mp_per_s']:.2f}" if r["mp_per_s"] else "-"
+            mem = f"{r['mem_delta_mb']:+.1f}" if r["mem_delta_mb"] is not None else "-"
+            print(f"  {r['kind']:<6} {r['name'][:40]:<40} {r['seconds']:>9.4f} {mp:>7} {rate:>9} {mem:>8}")
+        total = sum(r["seconds"] for r in records)
+        print(f"  {'total':<6} {'':<40} {total:>9.4f}")
+
+    def write_trace(self, path: str):
+        """Write every record as Chrome trace events (times in microseconds)."""
+        events = []
+        for r in self.records:
+            events.append({
+                "name": r["name"],
+                "cat": r["kind"],
+                "ph": "X",
+                "ts": r["start"] * 1e6,
+                "dur": r["seconds"] * 1e6,
+                "pid": os.getpid(),
+                "tid": 0,
+                "args": {"pixels": r["pixels"], "mp_per_s": r["mp_per_s"], "mem_delta_mb": r["mem_delta_mb"]},
+            })
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, indent=1)
@@ -0,0 +1,255 @@
+"""
+recipes.py - JSON recipe files and a cost-based planner for filter chains.
+
+A recipe names its stages and gives every parameter, so a job runs the
+same way each time without prompting:
+
+    {
+      "input": "photo.jpg",
+      "output": "result.png",
+      "stages": [
+        "Sepia",
+        {"name": "Smoothing (blur)"},
+        "Grayscale",
+        {"name": "Pixelate", "block_size": 8}
+      ]
+    }
+
+`input` and `output` are optional (-i and -o take precedence), and
+`"reorder": false` keeps the stages in the order written. Several outputs
+can be written from one decode by naming a chain for each; `stages`, if
+given, then starts every chain (see fanout.py):
+
+    "outputs": {
+      "thumb.png": [{"name": "Pixelate", "block_size": 8}],
+      "soft.png": ["Smoothing (blur)"]
+    }
+
+Chains are reordered by `interface.optimize_stages`, which only makes
+changes that leave every output pixel identical. `print_plan` shows the
+planned steps for a dry run with each step's time estimated from the image
+size and a per-filter cost in nanoseconds per pixel, either built in or
+measured on this machine with `python bench.py --calibrate`.
+"""
+
+import json
+import os
+
+import cache
+import formats
+import functions as F
+import interface
+from interface import _col, BOLD, CYAN, GREEN, RED
+
+COSTS_FILE = os.path.join(cache.DEFAULT_DIR, "costs.json")
+
+RECIPE_KEYS = ("input", "output", "stages", "outputs", "reorder", "description")
+
+# Nanoseconds per pixel on RGB and single-channel images, measured on one
+# core with `bench.py --calibrate`. On another machine the estimates are off
+# by a roughly constant factor until it is calibrated.
+DEFAULT_COSTS = {
+    "numpy": {
+        "grayscale": (0.7, 0.0),
+        "negative": (15.0, 3.0),
+        "red_filter": (14.0, 16.0),
+        "increase_brightness": (15.0, 3.0),
+        "decrease_brightness": (15.0, 3.0),
+        "contrast": (15.0, 3.0),
+        "thresholding": (15.0, 3.0),
+        "pixelate": (35.0, 7.0),
+        "sepia": (68.0, 69.0),
+        "smoothing": (65.0, 13.0),
+        "sharpen": (69.0, 11.0),
+        "gradient": (65.0, 10.0),
+        "auto_contrast": (29.0, 6.0),
+        "otsu_threshold": (30.0, 6.0),
+        "equalize": (29.0, 6.0),
+    },
+    "reference": {
+        "grayscale": (2.0, 0.1),
+        "negative": (3850.0, 3850.0),
+        "red_filter": (3820.0, 3820.0),
+        "increase_brightness": (3870.0, 3940.0),
+        "decrease_brightness": (3860.0, 3830.0),
+        "contrast": (3900.0, 3890.0),
+        "thresholding": (3690.0, 3860.0),
+        "pixelate": (4140.0, 4140.0),
+        "sepia": (4550.0, 4540.0),
+        "smoothing": (9700.0, 9500.0),
+        "sharpen": (13100.0, 13600.0),
+        "gradient": (13800.0, 13800.0),
+        "auto_contrast": (2800.0, 2750.0),
+        "otsu_threshold": (2800.0, 2760.0),
+        "equalize": (2880.0, 2770.0),
+    },
+}
+
+
+### Recipes ###
+
+def parse_stages(items):
+    """Resolve a list of filter names/numbers or {"name": ..., params} objects.
+
+    Returns (name, func, params) stages; raises ValueError.
+    """
+    if isinstance(items, str):
+        items = [t.strip() for t in items.split(",") if t.strip()]
+    if not isinstance(items, list) or not items:
+        raise ValueError("Stages must be a non-empty list or comma-separated string")
+    return [interface.resolve_stage(item) for item in items]
+
+
+def _stage_items(stages):
+    if isinstance(stages, str):
+        stages = [t.strip() for t in stages.split(",") if t.strip()]
+    if isinstance(stages, list):
+        # Filter numbers may be written as JSON numbers
+        stages = [item if isinstance(item, dict) else str(item) for item in stages]
+    parse_stages(stages)
+    return stages
+
+
+def load_recipe(path: str):
+    """Read and validate a recipe file. Returns a dict with input, output, stages, outputs and reorder.
+
+    stages are the recipe's own entries, which interface.plan_chain accepts
+    as tokens; they are checked here so that planning cannot prompt.
+    outputs is a list of (output path, stages) for fan-out recipes.
+    """
+    with open(path) as f:
+        try:
+            recipe = json.load(f)
+        except ValueError as e:
+            raise ValueError(f"{path} is not valid JSON: {e}") from None
+    if not isinstance(recipe, dict):
+        raise ValueError("A recipe must be a JSON object")
+    unknown = set(recipe) - set(RECIPE_KEYS)
+    if unknown:
+        raise ValueError(f"Unknown recipe key(s): {', '.join(sorted(unknown))}")
+    for key in ("input", "output"):
+        if recipe.get(key) is not None and not isinstance(recipe[key], str):
+            raise ValueError(f"Recipe {key!r} must be a path")
+    if not isinstance(recipe.get("reorder", True), bool):
+        raise ValueError("Recipe 'reorder' must be true or false")
+    if "stages" not in recipe and "outputs" not in recipe:
+        raise ValueError("A recipe needs a 'stages' list or an 'outputs' object")
+    outputs = recipe.get("outputs", {})
+    if not isinstance(outputs, dict):
+        raise ValueError("Recipe 'outputs' must map output paths to stage lists")
+    chains = []
+    for output, stages in outputs.items():
+        try:
+            chains.append((output, _stage_items(stages)))
+        except ValueError as e:
+            raise ValueError(f"Output {output!r}: {e}") from None
+    return {
+        "input": recipe.get("input"),
+        "output": recipe.get("output"),
+        "stages": _stage_items(recipe["stages"]) if "stages" in recipe else [],
+        "outputs": chains,
+        "reorder": recipe.get("reorder", True),
+    }
+
+
+### Cost model ###
+
+def load_costs(backend: str = None):
+    """Return {filter: (rgb_ns, gray_ns)} for backend, calibrated if available. Also returns the source."""
+    backend = backend or F.backend
+    costs = dict(DEFAULT_COSTS.get(backend, DEFAULT_COSTS["reference"]))
+    try:
+        with open(COSTS_FILE) as f:
+            calibrated = json.load(f).get(backend)
+    except (OSError, ValueError):
+        calibrated = None
+    if not calibrated:
+        return costs, "built-in costs"
+    costs.update({name: tuple(rates) for name, rates in calibrated.get("costs", {}).items()})
+    return costs, f"costs calibrated with {calibrated.get('threads', 1)} thread(s)"
+
+
+def save_costs(backend: str, costs, threads: int):
+    """Store measured costs for backend in COSTS_FILE, keeping other backends'."""
+    try:
+        with open(COSTS_FILE) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        data = {}
+    data[backend] = {"threads": threads, "costs": {name: list(rates) for name, rates in costs.items()}}
+    os.makedirs(os.path.dirname(COSTS_FILE), exist_ok=True)
+    with open(COSTS_FILE, "w") as f:
+        json.dump(data, f, indent=2)
+
+
+def estimate(steps, size, gray: bool = False, costs=None):
+    """Return (seconds, single_channel) for each step on an image of size.
+
+    single_channel tells whether the step processes one channel rather than
+    three. Stages fused into one step share a pass, so a step costs as much
+    as its most expensive stage. Multi-pass blurs cost one pass per pass.
+    """
+    if costs is None:
+        costs, _ = load_costs()
+    pixels = size[0] * size[1]
+    estimates = []
+    for step in steps:
+        if any(F.adds_colour(func) for _, func, _ in step):
+            gray = False
+        rate = max(costs.get(func.__name__, (0.0, 0.0))[1 if gray else 0] * params.get("passes", 1)
+                   for _, func, params in step)
+        estimates.append((rate * pixels / 1e9, gray))
+        for _, func, _ in step:
+            if func.__name__ == "grayscale":
+                gray = True
+    return estimates
+
+
+def probe(path: str):
+    """Return (size, single_channel, frame_count) of an image file without decoding it."""
+    from PIL import Image
+
+    if os.path.splitext(path)[1].lower() in formats.RAW_EXTENSIONS:
+        img = formats.open_image(path)
+        return img.size, F.is_gray(img), 1
+    with Image.open(path) as img:
+        return img.size, img.mode in ("1", "L", "LA", "I", "I;16", "F"), getattr(img, "n_frames", 1)
+
+
+def _seconds(seconds: float) -> str:
+    return f"{seconds:.2f} s" if seconds >= 1 else f"{seconds * 1000:.1f} ms"
+
+
+def print_plan(paths, steps):
+    """Print the steps, their estimated time on each input and the total, without running them.
+
+    Inputs that cannot be read are reported and left out of the estimate,
+    as a batch run would skip them.
+    """
+    costs, source = load_costs()
+    total = 0.0
+    shown = False
+    skipped = 0
+    for path in paths:
+        try:
+            size, gray, frames = probe(path)
+        except (OSError, ValueError) as e:
+            skipped += 1
+            print(_col("Skipped:", RED), _col(path, BOLD), "->", _col(str(e), RED))
+            continue
+        estimates = estimate(steps, size, gray, costs)
+        seconds = sum(s for s, _ in estimates) * frames
+        total += seconds
+        if shown:
+            continue
+        shown = True
+        extra = f", {frames} frames" if frames > 1 else ""
+        print(_col("Plan for", GREEN), _col(path, BOLD), _col(f"({size[0]}x{size[1]}{extra})", CYAN))
+        for n, (step, (step_seconds, single)) in enumerate(zip(steps, estimates), 1):
+            label = " + ".join(name for name, _, _ in step)
+            channels = "1 channel" if single else "3 channels"
+            print(f"  {n}. {label:<40} {channels:<11} {_seconds(step_seconds * frames):>10}")
+    if len(paths) > 1:
+        print(_col("Inputs:", CYAN), len(paths) - skipped, f"({skipped} skipped)" if skipped else "")
+    print(_col("Estimated time:", GREEN), _col(_seconds(total), BOLD),
+          f"({F.backend} backend, {source})")
@@ -0,0 +1,287 @@
+"""
+server.py - Long-running local job server with a warm worker pool.
+
+Starting Python, importing Pillow and NumPy and spawning a pool costs far
+more than filtering a small image, so `serve` pays it once: worker processes
+are started and warmed up front, and jobs arrive over localhost HTTP.
+
+    POST /jobs   {"input": "in.jpg", "output": "out.jpg",
+                  "filters": ["sepia", {"name": "Pixelate", "block_size": 8}]}
+    GET  /stats  queue depth, counters and latency percentiles
+    GET  /health
+
+Filters are names or numbers as in the menu; filters that normally prompt
+take their parameters in an object instead. A job's response is sent when it
+finishes. At most `workers + queue_size` jobs are accepted at once; beyond
+that the server answers 503 with a Retry-After header, which `submit` honours.
+Paths are resolved by the server against its root directory (`--root`,
+by default the directory it was started in), and jobs may only read and
+write files inside it. The server only listens on loopback addresses.
+"""
+
+import collections
+import ipaddress
+import json
+import os
+import signal
+import socket
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import Pool
+
+import batch
+import formats
+import functions as F
+import interface
+import recipes
+from interface import _col, BOLD, CYAN, GREEN, RED, YELLOW
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_QUEUE = 64
+
+# Latency percentiles are computed over this many most recent jobs
+LATENCY_WINDOW = 1000
+
+# Largest request body accepted; a job is a few hundred bytes of JSON
+MAX_BODY_BYTES = 1 << 20
+
+
+def plan_job(filters):
+    """Plan a job's filter list without prompting. Returns steps; raises ValueError."""
+    try:
+        stages = recipes.parse_stages(filters)
+    except ValueError as e:
+        raise ValueError(f"'filters': {e}") from None
+    return interface.group_stages(stages)
+
+
+def _warm_worker(*settings):
+    # Ctrl+C is handled by the server process, which then closes the pool
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    batch._init_worker(*settings)
+    # Import the engine now rather than on the first job
+    F._fast()
+
+
+def _percentiles(values):
+    if not values:
+        return None
+    ordered = sorted(values)
+
+    def pick(q):
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    return {"p50": pick(0.5), "p95": pick(0.95), "max": ordered[-1]}
+
+
+class JobServer:
+    """Runs jobs on a warm process pool, admitting at most workers + queue_size at once."""
+
+    def __init__(self, workers: int = None, queue_size: int = DEFAULT_QUEUE, threads: int = 1, root: str = None):
+        self.workers = workers or os.cpu_count() or 1
+        self.root = os.path.realpath(root or os.getcwd())
+        self.capacity = self.workers + queue_size
+        self.pool = Pool(self.workers, initializer=_warm_worker, initargs=batch.worker_settings(threads))
+        self.started = time.time()
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        # (total, queued, running) seconds per finished job
+        self.latencies = collections.deque(maxlen=LATENCY_WINDOW)
+        self._lock = threading.Lock()
+
+    def submit(self, job):
+        """Run one job dict and wait for it. Returns (http_status, response dict)."""
+        try:
+            if not isinstance(job, dict):
+                raise ValueError("A job must be a JSON object")
+            source, output = job.get("input"), job.get("output")
+            if not isinstance(source, str) or not isinstance(output, str):
+                raise ValueError("'input' and 'output' paths are required")
+            source, output = self.resolve(source), self.resolve(output)
+            steps = plan_job(job.get("filters"))
+        except ValueError as e:
+            return 400, {"ok": False, "error": str(e)}
+
+        with self._lock:
+            if self.in_flight >= self.capacity:
+                self.rejected += 1
+                return 503, {"ok": False, "error": "Queue full", "queue_depth": self._queue_depth()}
+            self.in_flight += 1
+        submitted = time.perf_counter()
+        try:
+            _, error, pixels, seconds, saved = self.pool.apply_async(batch._process, ((source, output, steps),)).get()
+        except Exception as e:
+            error, pixels, seconds, saved = str(e), 0, 0.0, None
+        total = time.perf_counter() - submitted
+        with self._lock:
+            self.in_flight -= 1
+            if error is None:
+                self.completed += 1
+            else:
+                self.failed += 1
+            self.latencies.append((total, max(0.0, total - seconds), seconds))
+
+        body = {"ok": error is None, "output": output, "pixels": pixels,
+                "seconds": seconds, "queue_seconds": max(0.0, total - seconds), "total_seconds": total}
+        if saved is not None:
+            body["output"], body["save_seconds"], body["bytes"] = saved
+        if error is not None:
+            body["error"] = error
+        return (200 if error is None else 422), body
+
+    def resolve(self, path: str) -> str:
+        """Return path resolved against the root, following links; raises ValueError if it leads outside."""
+        resolved = os.path.realpath(os.path.join(self.root, path))
+        if os.path.commonpath([self.root, resolved]) != self.root:
+            raise ValueError(f"{path!r} is outside the server root {self.root}")
+        return resolved
+
+    def _queue_depth(self) -> int:
+        return max(0, self.in_flight - self.workers)
+
+    def stats(self):
+        with self._lock:
+            latencies = list(self.latencies)
+            return {
+                "workers": self.workers,
+                "capacity": self.capacity,
+                "in_flight": self.in_flight,
+                "queue_depth": self._queue_depth(),
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "uptime_seconds": time.time() - self.started,
+                "latency_seconds": {
+                    "total": _percentiles([t for t, _, _ in latencies]),
+                    "queued": _percentiles([q for _, q, _ in latencies]),
+                    "running": _percentiles([r for _, _, r in latencies]),
+                },
+            }
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "ImageTreatment/1"
+
+    def _send(self, status: int, body, headers=()):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self._send(200, self.server.jobs.stats())
+        elif self.path == "/health":
+            self._send(200, {"ok": True})
+        else:
+            self._send(404, {"ok": False, "error": f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        if self.path != "/jobs":
+            self._send(404, {"ok": False, "error": f"Unknown path {self.path}"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+        except ValueError:
+            length = -1
+        if length < 0:
+            self._send(400, {"ok": False, "error": "Invalid Content-Length"})
+            return
+        if length > MAX_BODY_BYTES:
+            self.close_connection = True
+            self._send(413, {"ok": False, "error": f"Body larger than {MAX_BODY_BYTES} bytes"})
+            return
+        try:
+            job = json.loads(self.rfile.read(length) or b"null")
+        except ValueError:
+            self._send(400, {"ok": False, "error": "Body must be JSON"})
+            return
+        status, body = self.server.jobs.submit(job)
+        self._send(status, body, [("Retry-After", "1")] if status == 503 else ())
+
+    def log_message(self, format, *args):
+        # Per-request access logs would drown the terminal; /stats has the numbers
+        pass
+
+
+def check_loopback(host: str):
+    """Raise ValueError unless every address host resolves to is a loopback address."""
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, None)}
+    except socket.gaierror as e:
+        raise ValueError(f"Cannot resolve host {host!r}: {e}") from None
+    exposed = sorted(a for a in addresses if not ipaddress.ip_address(a.split("%")[0]).is_loopback)
+    if exposed:
+        raise ValueError(f"Jobs read and write local files, so the server only listens on loopback "
+                         f"addresses; {host!r} resolves to {', '.join(exposed)}")
+
+
+def serve(host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, workers: int = None,
+          queue_size: int = DEFAULT_QUEUE, threads: int = 1, root: str = None):
+    """Run the job server until interrupted. Raises ValueError for a non-loopback host."""
+    check_loopback(host)
+    if root is not None and not os.path.isdir(root):
+        raise ValueError(f"Server root {root!r} is not a directory")
+    jobs = JobServer(workers, queue_size, threads, root)
+    httpd = ThreadingHTTPServer((host, port), _Handler)
+    httpd.daemon_threads = True
+    httpd.jobs = jobs
+    print(_col("Serving on", GREEN), _col(f"http://{host}:{httpd.server_address[1]}", BOLD),
+          f"with {jobs.workers} worker(s), queue {queue_size}, root {jobs.root}", _col("(Ctrl+C to stop)", CYAN))
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        print(_col("\nStopping server.", YELLOW))
+    finally:
+        httpd.server_close()
+        jobs.close()
+
+
+def submit(url: str, job, retries: int = 10, timeout: float = 600):
+    """POST a job to a running server, waiting out 503 responses. Returns the response dict."""
+    data = json.dumps(job).encode("utf-8")
+    for attempt in range(retries + 1):
+        request = urllib.request.Request(url.rstrip("/") + "/jobs", data=data,
+                                         headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            body = json.loads(e.read() or b"{}")
+            if e.code != 503 or attempt == retries:
+                return body
+            time.sleep(float(e.headers.get("Retry-After", 1)))
+        except OSError as e:
+            # URLError (server down, bad host) and timeouts
+            return {"ok": False, "error": f"Cannot reach {url}: {getattr(e, 'reason', e)}"}
+
+
+def submit_chain(url: str, source: str, output: str, tokens):
+    """Plan tokens locally (asking for parameters) and run them on the server at url."""
+    steps = interface.plan_chain(tokens)
+    if not steps:
+        print(_col("No valid filters to apply.", YELLOW))
+        return None
+    filters = [dict(params, name=name) for step in steps for name, _, params in step]
+    result = submit(url, {"input": os.path.abspath(source), "output": os.path.abspath(output), "filters": filters})
+    if result.get("ok"):
+        print(_col("Saved final image as", GREEN), _col(result["output"], BOLD),
+              f"({result['seconds']:.3f}s running, {result['queue_seconds']:.3f}s queued;",
+              f"{formats.describe(result['save_seconds'], result['bytes'])} saving)")
+    else:
+        print(_col("Server error:", RED), _col(result.get("error", "unknown"), RED))
+    return result
@@ -0,0 +1,202 @@
+"""
+snapshots.py - Memory-bounded undo/redo history for the interactive session.
+
+`SnapshotStore` keeps one state per applied chain, starting with the loaded
+image. States close to the current position stay as raw in-memory copies so
+stepping back and forth is near-instant. When the memory budget is exceeded
+the states farthest from the current position are zlib-compressed, then
+spilled to a temporary directory, and finally dropped; a dropped state is
+recomputed by replaying the recorded steps from the nearest earlier state
+that is still stored. The first state is never dropped.
+"""
+
+import os
+import tempfile
+import zlib
+
+DEFAULT_BUDGET_MB = 512
+DEFAULT_DISK_MB = 2048
+
+
+def _pixel_bytes(mode: str) -> int:
+    """Bytes Pillow allocates per pixel in mode; images of several bands use 4, padded if needed (RGB, LA)."""
+    if mode in ("1", "L", "P"):
+        return 1
+    if mode.startswith("I;16"):
+        return 2
+    return 4
+
+
+class _Snapshot:
+    """One state: the steps that produced it and the image in one storage tier."""
+
+    def __init__(self, steps, img):
+        self.steps = steps
+        self.image = img.copy()
+        self.meta = (img.mode, img.size, img.getpalette() if img.mode == "P" else None)
+        self.packed = None
+        self.path = None
+
+    @property
+    def tier(self) -> str:
+        if self.image is not None:
+            return "raw"
+        if self.packed is not None:
+            return "compressed"
+        if self.path is not None:
+            return "spilled"
+        return "dropped"
+
+    def memory_bytes(self) -> int:
+        if self.image is not None:
+            return _pixel_bytes(self.image.mode) * self.image.size[0] * self.image.size[1]
+        if self.packed is not None:
+            return len(self.packed)
+        return 0
+
+    def disk_bytes(self) -> int:
+        return os.path.getsize(self.path) if self.path else 0
+
+    def compress(self):
+        self.packed = zlib.compress(self.image.tobytes(), 1)
+        self.image = None
+
+    def spill(self, directory: str, index: int):
+        self.path = os.path.join(directory, f"state_{index}_{id(self)}.z")
+        with open(self.path, "wb") as f:
+            f.write(self.packed)
+        self.packed = None
+
+    def drop(self):
+        if self.path:
+            os.remove(self.path)
+        self.image = self.packed = self.path = None
+
+    def load(self):
+        """Return a fresh copy of the stored image, or None if it was dropped."""
+        if self.image is not None:
+            return self.image.copy()
+        if self.packed is not None:
+            data = zlib.decompress(self.packed)
+        elif self.path is not None:
+            with open(self.path, "rb") as f:
+                data = zlib.decompress(f.read())
+        else:
+            return None
+        from PIL import Image
+
+        mode, size, palette = self.meta
+        img = Image.frombytes(mode, size, data)
+        if palette is not None:
+            img.putpalette(palette)
+        return img
+
+
+class SnapshotStore:
+    """Undo/redo history bounded by a memory budget (and a disk budget for spills).
+
+    replay(img, steps) must re-apply recorded steps to img in place; it is
+    used to rebuild states that were dropped.
+    """
+
+    def __init__(self, replay, budget_mb: float = DEFAULT_BUDGET_MB, disk_mb: float = DEFAULT_DISK_MB):
+        self.replay = replay
+        self.budget = int(budget_mb * 1e6)
+        self.disk_budget = int(disk_mb * 1e6)
+        self.states = []
+        self.pos = -1
+        self._tmpdir = None
+
+    def reset(self, img):
+        """Start a new history whose first state is img."""
+        self.clear()
+        self.states = [_Snapshot([], img)]
+        self.pos = 0
+
+    def clear(self):
+        for state in self.states:
+            state.drop()
+        self.states = []
+        self.pos = -1
+
+    def close(self):
+        self.clear()
+        if self._tmpdir is not None:
+            self._tmpdir.cleanup()
+            self._tmpdir = None
+
+    def push(self, img, steps):
+        """Record img as the state reached by applying steps; discards any redo states."""
+        for state in self.states[self.pos + 1:]:
+            state.drop()
+        del self.states[self.pos + 1:]
+        self.states.append(_Snapshot(steps, img))
+        self.pos += 1
+        self._enforce()
+
+    def can_undo(self) -> bool:
+        return self.pos > 0
+
+    def can_redo(self) -> bool:
+        return 0 <= self.pos < len(self.states) - 1
+
+    def undo(self):
+        """Move back one state. Returns (image, steps undone)."""
+        steps = self.states[self.pos].steps
+        self.pos -= 1
+        return self._restore(self.pos), steps
+
+    def redo(self):
+        """Move forward one state. Returns (image, steps redone)."""
+        self.pos += 1
+        return self._restore(self.pos), self.states[self.pos].steps
+
+    def _restore(self, index: int):
+        start = index
+        while self.states[start].tier == "dropped":
+            start -= 1
+        img = self.states[start].load()
+        for state in self.states[start + 1:index + 1]:
+            self.replay(img, state.steps)
+        if start != index:
+            # Keep the rebuilt state so moving back and forth stays fast
+            self.states[index] = _Snapshot(self.states[index].steps, img)
+            self._enforce()
+        return img
+
+    def _enforce(self):
+        """Demote the states farthest from the current position until budgets are met."""
+        order = sorted(range(len(self.states)), key=lambda i: -abs(i - self.pos))
+        for i in order:
+            if sum(s.memory_bytes() for s in self.states) <= self.budget:
+                break
+            if i == self.pos:
+                continue
+            state = self.states[i]
+            if state.tier == "raw":
+                state.compress()
+            if state.tier == "compressed" and sum(s.memory_bytes() for s in self.states) > self.budget:
+                self._spill(state, i)
+        disk = sum(s.disk_bytes() for s in self.states)
+        for i in order:
+            if disk <= self.disk_budget:
+                break
+            state = self.states[i]
+            if i in (0, self.pos) or state.tier != "spilled":
+                continue
+            disk -= state.disk_bytes()
+            state.drop()
+
+    def _spill(self, state, index: int):
+        if self._tmpdir is None:
+            self._tmpdir = tempfile.TemporaryDirectory(prefix="image_treatment_undo_")
+        state.spill(self._tmpdir.name, index)
+
+    def usage(self):
+        """Return a dict summarising how many states sit in each tier and their size."""
+        tiers = {"raw": 0, "compressed": 0, "spilled": 0, "dropped": 0}
+        for state in self.states:
+            tiers[state.tier] += 1
+        tiers["memory_mb"] = sum(s.memory_bytes() for s in self.states) / 1e6
+        tiers["disk_mb"] = sum(s.disk_bytes() for s in self.states) / 1e6
+        return tiers
@@ -0,0 +1,250 @@
+"""
+tiles.py - Strip-by-strip execution for images too large to hold in memory.
+
+The image is processed in horizontal strips. Each strip is read together
+with the halo rows its neighbourhood filters need (widened to block
+boundaries for pixelate), filtered as a small image, trimmed back to the
+strip and written out before the next strip is read.
+
+Binary PPM (P6) and NumPy `.npy` files are read and written through memory
+maps, so peak memory follows the strip size. Other formats still go
+through Pillow, which decodes and encodes them whole. Adaptive filters
+(auto contrast, Otsu threshold, equalize) first count their histograms in
+an extra pass over the strips.
+
+Strips are always RGB: alpha channels are dropped on reading and grayscale
+results are written with three equal channels.
+"""
+
+import math
+import os
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+import engine as E
+import formats
+import frames
+import functions as F
+import interface
+from interface import _col, BOLD, CYAN, GREEN, RED, YELLOW
+
+DEFAULT_TILE_ROWS = 512
+
+
+### Readers ###
+
+class _MemmapRows:
+    """Rows of an HxWx3 uint8 image backed by a memory-mapped file."""
+
+    def __init__(self, data):
+        self.data = data
+        self.size = (data.shape[1], data.shape[0])
+
+    def read(self, y0, y1):
+        return np.array(self.data[y0:y1])
+
+    def close(self):
+        del self.data
+
+
+class _PillowRows:
+    """Rows of an image decoded by Pillow (the whole image is decoded once)."""
+
+    def __init__(self, path):
+        # Converted whole, so 16-bit and float samples scale the same in every strip
+        self.img = F.normalize_mode(Image.open(path))
+        self.size = self.img.size
+
+    def read(self, y0, y1):
+        return E.to_array(self.img.crop((0, y0, self.size[0], y1)).convert("RGB"))
+
+    def close(self):
+        self.img.close()
+
+
+def open_rows(path: str):
+    """Open an image for reading row ranges; memory-mapped for .ppm and .npy."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".npy":
+        data = np.load(path, mmap_mode="r")
+        if data.dtype != np.uint8 or data.ndim != 3 or data.shape[2] != 3:
+            raise ValueError("Expected an HxWx3 uint8 array in " + path)
+        return _MemmapRows(data)
+    if ext == ".ppm":
+        with open(path, "rb") as f:
+            magic, width, height, maxval, offset = formats.read_pnm_header(f)
+        if magic != b"P6":
+            raise ValueError("Only binary RGB PPM (P6) files can be streamed")
+        if maxval != 255:
+            raise ValueError("Only 8-bit PPM files can be streamed")
+        return _MemmapRows(np.memmap(path, dtype=np.uint8, mode="r", offset=offset, shape=(height, width, 3)))
+    return _PillowRows(path)
+
+
+### Writers ###
+
+class _PPMWriter:
+    def __init__(self, path, size):
+        self.f = open(path, "wb")
+        self.f.write(f"P6\n{size[0]} {size[1]}\n255\n".encode("ascii"))
+
+    def write(self, rows):
+        self.f.write(np.ascontiguousarray(rows).tobytes())
+
+    def close(self):
+        self.f.close()
+
+
+class _NPYWriter:
+    def __init__(self, path, size):
+        self.data = np.lib.format.open_memmap(path, mode="w+", dtype=np.uint8, shape=(size[1], size[0], 3))
+        self.y = 0
+
+    def write(self, rows):
+        self.data[self.y:self.y + len(rows)] = rows
+        self.y += len(rows)
+
+    def close(self):
+        self.data.flush()
+        del self.data
+
+
+class _PillowWriter(_NPYWriter):
+    """Collects strips in a temporary memory map and encodes them with Pillow on close."""
+
+    def __init__(self, path, size):
+        fd, self.tmp = tempfile.mkstemp(suffix=".npy")
+        os.close(fd)
+        super().__init__(self.tmp, size)
+        self.path = path
+
+    def close(self):
+        try:
+            if self.y == self.data.shape[0]:
+                formats.save(Image.fromarray(np.asarray(self.data)), self.path)
+        finally:
+            del self.data
+            os.remove(self.tmp)
+
+
+def open_writer(path: str, size):
+    """Open an output that accepts strips of rows from top to bottom."""
+    path = formats.output_path(path)
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".ppm":
+        return _PPMWriter(path, size)
+    if ext == ".npy":
+        return _NPYWriter(path, size)
+    return _PillowWriter(path, size)
+
+
+### Planning ###
+
+def window_rows(footprints, y0: int, y1: int, height: int, align: int = 1):
+    """Return the input rows [a, b) needed to compute output rows [y0, y1).
+
+    footprints are the (halo_rows, block_rows) of each stage in order. The
+    range is grown backwards through the chain and aligned to `align` so
+    that block-based stages see whole blocks at their image positions.
+    """
+    a, b = y0, y1
+    for halo, block in reversed(footprints):
+        if block > 1:
+            a = a // block * block
+            b = min(-(-b // block) * block, height)
+        a = max(a - halo, 0)
+        b = min(b + halo, height)
+    a = a // align * align
+    b = min(-(-b // align) * align, height)
+    return a, b
+
+
+def _filtered_strips(reader, steps, footprints, strip: int, align: int):
+    """Yield the rows of every strip of the image, top to bottom, after applying steps."""
+    height = reader.size[1]
+    for y0 in range(0, height, strip):
+        y1 = min(y0 + strip, height)
+        a, b = window_rows(footprints, y0, y1, height, align)
+        window = Image.fromarray(reader.read(a, b))
+        interface.apply_steps(window, steps)
+        if window.mode != "RGB":
+            window = window.convert("RGB")
+        yield E.to_array(window)[y0 - a:y1 - a]
+
+
+def _resolve_adaptive(reader, stages, footprints, strip: int, align: int):
+    """Give adaptive stages explicit parameters from histograms counted strip by strip.
+
+    Each adaptive stage costs one extra pass over the image through the
+    stages before it.
+    """
+    stages = list(stages)
+    for k, (name, func, params) in enumerate(stages):
+        if not F.is_adaptive(func) or params:
+            continue
+        print(_col("Counting histograms for", YELLOW), _col(name, BOLD), _col("...", YELLOW))
+        prefix = interface.group_stages(stages[:k])
+        hist = sum(E.channel_histograms(rows) for rows in _filtered_strips(reader, prefix, footprints[:k], strip, align))
+        stages[k] = (name, func, F.adaptive_params(func, hist.tolist()))
+    return stages
+
+
+def run_tiled(input_filename: str, output_filename: str, tokens, tile_rows: int = DEFAULT_TILE_ROWS):
+    """Apply filter tokens to an image strip by strip. Returns True on success."""
+    if F.border == "wrap":
+        print(_col("Tiled mode does not support the 'wrap' border.", RED))
+        return False
+    if tile_rows <= 0:
+        print(_col("Tile rows must be greater than zero.", RED))
+        return False
+    if frames.is_animated(input_filename):
+        print(_col("Tiled mode works on single-frame images; run without --tile-rows to filter every frame.", RED))
+        return False
+    steps = interface.plan_chain(tokens)
+    if not steps:
+        return False
+    stages = [(name, func, params) for step in steps for name, func, params in step]
+    footprints = [F.footprint(func, **params) for _, func, params in stages]
+    align = 1
+    for _, block in footprints:
+        align = align * block // math.gcd(align, block)
+    strip = max(align, tile_rows // align * align)
+
+    try:
+        reader = open_rows(input_filename)
+    except Exception as e:
+        print(_col("Failed to open:", RED), _col(input_filename, BOLD), "->", _col(str(e), RED))
+        return False
+    width, height = reader.size
+    print(_col("Loaded image:", GREEN), _col(input_filename, BOLD), _col(f"({width}x{height})", CYAN))
+    print(_col("Applying:", YELLOW), _col(", ".join(name for name, _, _ in stages), BOLD),
+          _col(f"in strips of {strip} rows ...", YELLOW))
+    output_filename = formats.output_path(output_filename)
+    saving = 0.0
+    try:
+        stages = _resolve_adaptive(reader, stages, footprints, strip, align)
+        steps = interface.group_stages(stages)
+        # The output may be the mapped input, so it is written beside it and swapped in at the end
+        with formats.replacing(output_filename) as target:
+            writer = open_writer(target, (width, height))
+            try:
+                for rows in _filtered_strips(reader, steps, footprints, strip, align):
+                    start = time.perf_counter()
+                    writer.write(rows)
+                    saving += time.perf_counter() - start
+            finally:
+                start = time.perf_counter()
+                writer.close()
+                saving += time.perf_counter() - start
+    except Exception as e:
+        print(_col("Tiled run failed:", RED), _col(str(e), RED))
+        return False
+    finally:
+        reader.close()
+    interface.record_history(name for name, _, _ in stages)
+    print(_col("Saved final image as", GREEN), _col(output_filename, BOLD),
+          _col(f"({formats.describe(saving, os.path.getsize(output_filename))})", CYAN))
+    return True